@@ -1,11 +1,34 @@
+import time
+_T_INICIO = time.perf_counter()  # referencia para medir el arranque (import → primer update)
+
+import io
 import os
+import sys
+import csv
+import hmac
+import json
+import base64
+import pickle
+import random
+import signal
+import hashlib
 import asyncio
+import logging
+import sqlite3
+import threading
+import traceback
+import contextvars
+from collections import Counter, OrderedDict, deque
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from typing import Dict, Tuple
-from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field, fields
+from functools import lru_cache, wraps
 from pathlib import Path
 
+import httpx
+import tornado.web
+from tornado.httpserver import HTTPServer
 from telegram import (
     Update,
     InlineKeyboardMarkup,
@@ -16,28 +39,70 @@ from telegram import (
     ReplyKeyboardRemove,
 )
 from telegram.constants import ChatAction
-from telegram.error import TimedOut, NetworkError
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
+    BasePersistence,
+    PersistenceInput,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
     ContextTypes,
     filters,
 )
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # =========================
 # CONFIGURACIÓN Y DATOS
 # =========================
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")  # En Railway lo pondrás como variable
+# Base de la Bot API; las pruebas la apuntan a un servidor local (tests/fake_bot_api.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
 USE_WEBHOOK = os.getenv("USE_WEBHOOK", "true").lower() == "true"
 PORT = int(os.getenv("PORT", "8080"))
 WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "")  # p.ej. https://tuapp.up.railway.app
-WEBHOOK_PATH = f"/webhook/{BOT_TOKEN}" if BOT_TOKEN else "/webhook"
-WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}" if WEBHOOK_HOST else ""
+# El servidor web propio (webhooks, /ready, /r/) solo corre en este modo; si no, polling
+MODO_WEBHOOK = USE_WEBHOOK and bool(WEBHOOK_HOST)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # opcional: Telegram lo envía en cada update
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Solo pedimos a Telegram los tipos de update que tienen handler
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# --- DATOS EXTERNOS (opcionales; si no se definen se usan los de este archivo) ---
+ROSTER_FILE = os.getenv("ROSTER_FILE", "")        # .json {clave: nombre} o .csv clave,nombre
+CATALOGO_FILE = os.getenv("CATALOGO_FILE", "")    # .json con presentadores / materiales / video_links / enlaces
+EVENTOS_FILE = os.getenv("EVENTOS_FILE", "")      # .json con varios eventos (ver cargar_eventos)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "64"))  # conexiones HTTP compartidas por todos los eventos
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))  # updates procesados en paralelo por evento
+SESION_ACTIVA_MIN = int(os.getenv("SESION_ACTIVA_MIN", "15"))     # minutos sin actividad para dejar de contar una sesión
+
+# --- PERFILADO (opt-in: 0 = deshabilitado) ---
+SLOW_HANDLER_MS = float(os.getenv("SLOW_HANDLER_MS", "0"))        # loguear handlers más lentos que esto
+LOOP_LAG_MS = float(os.getenv("LOOP_LAG_MS", "0"))                # alertar si el event loop se bloquea más que esto
+PERFIL_INTERVALO_MS = float(os.getenv("PERFIL_INTERVALO_MS", "5"))  # periodo de muestreo de /perfilar
+PERFIL_MAX_SEGUNDOS = int(os.getenv("PERFIL_MAX_SEGUNDOS", "60"))
+
+# --- REINTENTOS de llamadas a Telegram ---
+TG_INTENTOS = int(os.getenv("TG_INTENTOS", "3"))                        # intentos por llamada
+TG_INTENTOS_SUBIDA = int(os.getenv("TG_INTENTOS_SUBIDA", str(TG_INTENTOS)))  # intentos por subida de archivo
+TG_BACKOFF_BASE = float(os.getenv("TG_BACKOFF_BASE", "0.5"))            # segundos
+TG_BACKOFF_MAX = float(os.getenv("TG_BACKOFF_MAX", "8"))                # tope de espera por reintento
+TG_PRESUPUESTO_REINTENTOS = int(os.getenv("TG_PRESUPUESTO_REINTENTOS", "30"))  # reintentos globales...
+TG_PRESUPUESTO_VENTANA = float(os.getenv("TG_PRESUPUESTO_VENTANA", "10"))      # ...por esta ventana (s)
+TG_CIRCUITO_FALLOS = int(os.getenv("TG_CIRCUITO_FALLOS", "20"))         # fallos seguidos para abrir el circuito
+TG_CIRCUITO_ESPERA = float(os.getenv("TG_CIRCUITO_ESPERA", "30"))       # segundos con el circuito abierto
+
+# --- REDIRECCIONES (conteo de clics en botones con URL) ---
+REDIRECT_ENABLED = os.getenv("REDIRECT_ENABLED", "false").lower() == "true"
+REDIRECT_BASE_URL = os.getenv("REDIRECT_BASE_URL", WEBHOOK_HOST).rstrip("/")
+REDIRECT_SECRET = os.getenv("REDIRECT_SECRET", "") or hashlib.sha256((BOT_TOKEN or "").encode()).hexdigest()
+REDIRECT_PERSIST_INTERVALO = float(os.getenv("REDIRECT_PERSIST_INTERVALO", "60"))
 
 # --- PRE-LANZAMIENTO ---
 LAUNCH_DATE_STR = os.getenv("LAUNCH_DATE", "")         # 'YYYY-MM-DD'
@@ -52,6 +117,22 @@ PRELAUNCH_MESSAGE = os.getenv(
 WIFI_SSID = os.getenv("WIFI_SSID", "NombreDeRed")
 WIFI_PASS = os.getenv("WIFI_PASS", "Contrasena123")
 
+# --- ADMINISTRADORES (IDs de Telegram separados por coma) ---
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+
+# --- ANALÍTICA ---
+ANALYTICS_BACKEND = os.getenv("ANALYTICS_BACKEND", "jsonl").lower()  # jsonl | sqlite | postgres | off
+ANALYTICS_DB_URL = os.getenv("ANALYTICS_DB_URL", os.getenv("DATABASE_URL", ""))
+ANALYTICS_BUFFER = int(os.getenv("ANALYTICS_BUFFER", "10000"))       # eventos máx. en memoria
+ANALYTICS_LOTE = int(os.getenv("ANALYTICS_LOTE", "500"))             # eventos por escritura
+ANALYTICS_INTERVALO = float(os.getenv("ANALYTICS_INTERVALO", "5"))   # segundos entre vaciados
+ANALYTICS_JSONL_MAX_BYTES = int(os.getenv("ANALYTICS_JSONL_MAX_BYTES", str(5 * 1024 * 1024)))
+ANALYTICS_JSONL_BACKUPS = int(os.getenv("ANALYTICS_JSONL_BACKUPS", "5"))
+
+# --- PERSISTENCIA de user_data / chat_data / bot_data (vacío = solo memoria) ---
+PERSISTENCIA_URL = os.getenv("PERSISTENCIA_URL", os.getenv("DATABASE_URL", ""))  # postgres://... o sqlite:///...
+PERSISTENCIA_INTERVALO = float(os.getenv("PERSISTENCIA_INTERVALO", "30"))        # segundos entre escrituras
+
 def parse_fecha(date_str: str):
     try:
         y, m, d = map(int, date_str.split("-"))
@@ -62,24 +143,24 @@ def parse_fecha(date_str: str):
 def hoy_utc() -> datetime:
     return datetime.now(timezone.utc)
 
-def esta_en_prelanzamiento() -> tuple[bool, str]:
+def esta_en_prelanzamiento(evento: "Evento") -> tuple[bool, str]:
     """
-    True + mensaje si aún no se habilita el bot completo.
-    Habilita desde (LAUNCH_DATE - PRELAUNCH_DAYS).
-    Si LAUNCH_DATE no está, no hay pre-lanzamiento.
+    True + mensaje si aún no se habilita el bot completo para el evento.
+    Habilita desde (launch_date - prelaunch_days).
+    Si el evento no tiene launch_date, no hay pre-lanzamiento.
     """
-    launch_dt = parse_fecha(LAUNCH_DATE_STR)
+    launch_dt = parse_fecha(evento.launch_date)
     if not launch_dt:
         return (False, "")  # habilitado
 
-    habilita_dt = launch_dt - timedelta(days=PRELAUNCH_DAYS)
+    habilita_dt = launch_dt - timedelta(days=evento.prelaunch_days)
     now = hoy_utc()
     if now < habilita_dt:
         dias = (habilita_dt.date() - now.date()).days
         msg = (
             f"✨ El bot estará disponible 🔥 el día del evento.\n\n"
             f"⏳ Faltan {dias} días, vuelve pronto. 🙌\n\n"
-            f"{PRELAUNCH_MESSAGE}"
+            f"{evento.prelaunch_message}"
         )
         return (True, msg)
     return (False, "")
@@ -88,7 +169,7 @@ def esta_en_prelanzamiento() -> tuple[bool, str]:
 NOMBRE_EVENTO = "Bootcamp 2025 - 2 de JP Tactical Trading"
 
 BIENVENIDA = (
-    f"🎉 ¡Bienvenido/a al {NOMBRE_EVENTO}! 🎉\n\n"
+    "🎉 ¡Bienvenido/a al {evento}! 🎉\n\n"
     "Has sido validado correctamente.\n"
     "Usa el menú para navegar."
 )
@@ -214,9 +295,10 @@ USUARIOS_AUTORIZADOS: Dict[str, str] = {
 }
 
 DATA_DIR = Path(__file__).parent / "data"
-AGENDA_PDF = DATA_DIR / "agenda.pdf"   # Si no existe, se enviará texto
+AGENDA_PDF = DATA_DIR / "agenda.pdf"   # Agenda del evento único; si no existe, se enviará texto
 VIDEOS_DIR = DATA_DIR / "videos"
 DOCS_DIR = DATA_DIR / "docs"
+ANALYTICS_DIR = Path(os.getenv("ANALYTICS_DIR", str(DATA_DIR / "analytics")))
 
 # =========================
 # PRESENTADORES
@@ -315,6 +397,257 @@ UBICACION_URL = "https://maps.app.goo.gl/zZfR7kPo9ZR1AUtu9"
 EXNESS_ACCOUNT_URL = "https://one.exnesstrack.org/a/s3wj0b5qry"
 EXNESS_COPY_URL = "https://social-trading.exness.com/strategy/227834645/a/s3wj0b5qry?sharer=trader"
 
+# =========================
+# EVENTOS (configuración por evento / multi-tenant)
+# =========================
+# Un proceso puede atender varios bootcamps: cada uno con su token, inscritos,
+# catálogo, Wi-Fi, enlaces de conexión y ventana de pre-lanzamiento.
+# Sin EVENTOS_FILE hay un único evento armado con las variables y datos de arriba.
+# Con EVENTOS_FILE cada evento trae sus propios datos: no hereda nada de arriba.
+# Inscritos y catálogo se cargan la primera vez que se usan (o en post_init,
+# fuera del event loop). /recargar_* las reemplaza por una copia recién leída.
+
+WIFI_INSTRUCCIONES = (
+    "_*La red es abierta (no necesita clave) \n\n *Se abre una pestaña, le das en visitantes \n\n "
+    "*Escoges Estelar easy conection \n\n *Y escribes la palabra Estelar2025_"
+)
+
+@dataclass
+class Catalogo:
+    presentadores: List[Tuple[str, str]]
+    materiales: Dict[str, Dict[str, Dict[str, Path]]]
+    video_links: Dict[str, Dict[str, str]]
+    enlaces: Dict[str, Dict[str, str]]
+    agenda_pdf: Optional[Path] = None
+
+    def rutas(self) -> List[Path]:
+        rutas = [r for m in self.materiales.values() for grupo in m.values() for r in grupo.values()]
+        return [self.agenda_pdf, *rutas] if self.agenda_pdf else rutas
+
+    def nombre_presentador(self, pid: str) -> str:
+        return next((n for (i, n) in self.presentadores if i == pid), "Presentador")
+
+@dataclass
+class MetricasEvento:
+    """Contadores por evento para decidir cuántos eventos caben en una instancia."""
+    updates: int = 0
+    mensajes: int = 0
+    callbacks: int = 0
+    logins_ok: int = 0
+    logins_fallidos: int = 0
+
+    def resumen(self) -> str:
+        return (
+            f"{self.updates} updates · {self.mensajes} mensajes · {self.callbacks} callbacks · "
+            f"{self.logins_ok} logins ok · {self.logins_fallidos} fallidos"
+        )
+
+@dataclass
+class Evento:
+    codigo: str                     # "" = evento único (compatibilidad con el despliegue actual)
+    token: str
+    nombre: str = ""
+    launch_date: str = ""
+    prelaunch_days: int = 2
+    prelaunch_message: str = ""
+    wifi_ssid: str = ""
+    wifi_pass: str = ""
+    wifi_instrucciones: str = ""
+    ubicacion_url: str = ""
+    enlaces_conexion: Dict[str, str] = field(default_factory=dict)
+    roster_file: str = ""
+    catalogo_file: str = ""
+    metricas: MetricasEvento = field(default_factory=MetricasEvento)
+    _roster: Optional[Dict[str, str]] = field(default=None, repr=False)
+    _catalogo: Optional[Catalogo] = field(default=None, repr=False)
+
+    @property
+    def etiqueta(self) -> str:
+        return self.codigo or "principal"
+
+    @property
+    def webhook_path(self) -> str:
+        return f"/webhook/{self.token}"
+
+    def roster(self) -> Dict[str, str]:
+        """Inscritos autorizados, con la clave ya normalizada."""
+        if self._roster is None:
+            self._roster = cargar_roster(self.roster_file)
+        return self._roster
+
+    def catalogo(self) -> Catalogo:
+        if self._catalogo is None:
+            self._catalogo = cargar_catalogo(self.catalogo_file)
+        return self._catalogo
+
+    def recargar_roster(self) -> Dict[str, str]:
+        # Se arma el diccionario nuevo y se reemplaza con una sola asignación: un
+        # ingreso que llegue mientras tanto usa el anterior en lugar de leer el
+        # archivo desde el event loop
+        self._roster = cargar_roster(self.roster_file)
+        return self._roster
+
+    def recargar_catalogo(self) -> Catalogo:
+        self._catalogo = cargar_catalogo(self.catalogo_file)
+        return self._catalogo
+
+def cargar_roster(ruta_archivo: str) -> Dict[str, str]:
+    if not ruta_archivo:
+        return {normaliza(k): v for k, v in USUARIOS_AUTORIZADOS.items()}
+    ruta = Path(ruta_archivo)
+    with ruta.open(encoding="utf-8") as f:
+        if ruta.suffix.lower() == ".json":
+            datos = json.load(f)
+        else:
+            datos = {fila[0]: fila[1] for fila in csv.reader(f) if len(fila) >= 2}
+    return {normaliza(k): v.strip() for k, v in datos.items() if normaliza(k)}
+
+def cargar_catalogo(ruta_archivo: str) -> Catalogo:
+    """
+    Sin archivo: el catálogo definido en este módulo. Con archivo, el catálogo es
+    solo lo que trae el JSON (las secciones omitidas quedan vacías), p.ej.
+      {"presentadores": [["p1", "..."]], "materiales": {"p1": {"docs": {"Guía": "docs/guia.pdf"}}},
+       "video_links": {...}, "enlaces": {...}, "agenda_pdf": "medellin/agenda.pdf"}
+    Las rutas son relativas a data/.
+    """
+    if not ruta_archivo:
+        return Catalogo(PRESENTADORES, MATERIALES, VIDEO_LINKS, ENLACES_POR_PRESENTADOR, AGENDA_PDF)
+    with Path(ruta_archivo).open(encoding="utf-8") as f:
+        datos = json.load(f)
+    materiales = {
+        pid: {grupo: {titulo: DATA_DIR / rel for titulo, rel in archivos.items()}
+              for grupo, archivos in grupos.items()}
+        for pid, grupos in datos.get("materiales", {}).items()
+    }
+    agenda = datos.get("agenda_pdf")
+    return Catalogo(
+        [tuple(p) for p in datos.get("presentadores", [])],
+        materiales,
+        datos.get("video_links", {}),
+        datos.get("enlaces", {}),
+        DATA_DIR / agenda if agenda else None,
+    )
+
+def evento_por_defecto() -> Evento:
+    return Evento(
+        codigo="",
+        token=BOT_TOKEN or "",
+        nombre=NOMBRE_EVENTO,
+        launch_date=LAUNCH_DATE_STR,
+        prelaunch_days=PRELAUNCH_DAYS,
+        prelaunch_message=PRELAUNCH_MESSAGE,
+        wifi_ssid=WIFI_SSID,
+        wifi_pass=WIFI_PASS,
+        wifi_instrucciones=WIFI_INSTRUCCIONES,
+        ubicacion_url=UBICACION_URL,
+        enlaces_conexion=ENLACES_CONEXION,
+        roster_file=ROSTER_FILE,
+        catalogo_file=CATALOGO_FILE,
+    )
+
+# Campos que se pueden definir en EVENTOS_FILE (el resto son estado interno)
+CAMPOS_EVENTO = {f.name for f in fields(Evento)} - {"metricas", "_roster", "_catalogo"}
+
+def cargar_eventos() -> Dict[str, Evento]:
+    """
+    EVENTOS_FILE: lista JSON de eventos, p.ej.
+      [{"codigo": "medellin", "token_env": "BOT_TOKEN_MEDELLIN", "nombre": "...",
+        "launch_date": "2025-09-20", "roster_file": "data/medellin.csv",
+        "catalogo_file": "data/medellin.json", "wifi_ssid": "...",
+        "enlaces_conexion": {"Día 1": "https://..."}}]
+    Cada evento está aislado: no hereda inscritos, catálogo, Wi-Fi ni enlaces del
+    evento por defecto. roster_file y catalogo_file son obligatorios; los demás
+    campos omitidos quedan vacíos. Un campo desconocido es un error.
+    Devuelve {token: Evento}.
+    """
+    if not EVENTOS_FILE:
+        base = evento_por_defecto()
+        return {base.token: base} if base.token else {}
+    with Path(EVENTOS_FILE).open(encoding="utf-8") as f:
+        definiciones = json.load(f)
+    eventos: Dict[str, Evento] = {}
+    for d in definiciones:
+        d = dict(d)
+        token_env = d.pop("token_env", "")
+        if token_env:
+            d["token"] = os.getenv(token_env, "")
+        desconocidos = set(d) - CAMPOS_EVENTO
+        if desconocidos:
+            raise RuntimeError(f"Campos desconocidos en el evento {d.get('codigo')!r}: {', '.join(sorted(desconocidos))}")
+        faltantes = [c for c in ("codigo", "token", "roster_file", "catalogo_file") if not d.get(c)]
+        if faltantes:
+            raise RuntimeError(f"Evento {d.get('codigo')!r} sin {', '.join(faltantes)} en {EVENTOS_FILE}")
+        d.setdefault("nombre", d["codigo"])
+        evento = Evento(**d)
+        if evento.token in eventos:
+            raise RuntimeError(f"Token repetido en {EVENTOS_FILE}: {evento.codigo!r}")
+        eventos[evento.token] = evento
+    return eventos
+
+EVENTOS: Dict[str, Evento] = cargar_eventos()  # token -> Evento
+
+def evento_de(context: ContextTypes.DEFAULT_TYPE) -> Evento:
+    return EVENTOS[context.bot.token]
+
+@lru_cache(maxsize=None)
+def archivo_existe(ruta: Path) -> bool:
+    # Path.exists() es una llamada bloqueante al disco; la hacemos una sola vez por archivo
+    return ruta.exists()
+
+def calentar_caches(evento: Evento):
+    """Carga inscritos, catálogo y existencia de archivos (se llama en un hilo)."""
+    evento.roster()
+    for ruta in evento.catalogo().rutas():
+        archivo_existe(ruta)
+
+def recargar_roster(evento: Evento) -> int:
+    return len(evento.recargar_roster())
+
+def revisar_archivos():
+    """
+    Vuelve a mirar en disco los materiales de todos los eventos. archivo_existe
+    es una sola caché para el proceso: tras vaciarla se calientan todos, no solo
+    el evento que la pidió, para que ningún bot quede haciendo stat() en el loop.
+    """
+    archivo_existe.cache_clear()
+    for evento in list(EVENTOS.values()):
+        calentar_caches(evento)
+
+def recargar_catalogo(evento: Evento) -> int:
+    evento.recargar_catalogo()
+    revisar_archivos()
+    return len(evento.catalogo().rutas())
+
+# =========================
+# MÉTRICAS (arranque y por evento)
+# =========================
+
+ARRANQUE: Dict[str, float] = {}
+
+def marcar_arranque(etapa: str):
+    """Registra los ms transcurridos desde que empezó el import de este módulo."""
+    if etapa not in ARRANQUE:
+        ARRANQUE[etapa] = (time.perf_counter() - _T_INICIO) * 1000
+        logger.info("Arranque: %s a los %.0f ms", etapa, ARRANQUE[etapa])
+
+def resumen_arranque() -> str:
+    return " · ".join(f"{etapa} {ms:.0f} ms" for etapa, ms in ARRANQUE.items()) or "(sin datos)"
+
+async def contar_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Grupo -1: corre antes que los handlers normales, solo suma contadores."""
+    if "primer_update" not in ARRANQUE:
+        marcar_arranque("primer_update")
+    evento = evento_de(context)
+    metricas = evento.metricas
+    metricas.updates += 1
+    EN_VIVO.updates.sumar()
+    if esta_autenticado(context) and update.effective_user:
+        EN_VIVO.sesiones.tocar((evento.codigo, update.effective_user.id))
+    if update.callback_query:
+        metricas.callbacks += 1
+    elif update.message:
+        metricas.mensajes += 1
+
 # =========================
 # MENÚS
 # =========================
@@ -329,9 +662,9 @@ def principal_inline() -> InlineKeyboardMarkup:
         [InlineKeyboardButton("📶 Conectarme a la red", callback_data="menu_wifi")],  # NUEVO
     ])
 
-def presentadores_keyboard(prefix: str) -> InlineKeyboardMarkup:
+def presentadores_keyboard(evento: Evento, prefix: str) -> InlineKeyboardMarkup:
     rows = []
-    for pid, nombre in PRESENTADORES:
+    for pid, nombre in evento.catalogo().presentadores:
         rows.append([InlineKeyboardButton(nombre, callback_data=f"{prefix}:{pid}")])
     rows.append([InlineKeyboardButton("⬅️ Volver", callback_data="volver_menu_principal")])
     return InlineKeyboardMarkup(rows)
@@ -352,11 +685,11 @@ def lista_archivos_inline(diccionario: Dict[str, Path], prefix: str, pid: str) -
     rows.append([InlineKeyboardButton("⬅️ Volver", callback_data=f"mat_pres:{pid}")])
     return InlineKeyboardMarkup(rows)
 
-def lista_video_links_inline(pid: str) -> InlineKeyboardMarkup:
-    enlaces = VIDEO_LINKS.get(pid, {})
+def lista_video_links_inline(evento: Evento, pid: str) -> InlineKeyboardMarkup:
+    enlaces = evento.catalogo().video_links.get(pid, {})
     rows = []
     for nombre, url in enlaces.items():
-        rows.append([InlineKeyboardButton(nombre, url=url)])
+        rows.append([InlineKeyboardButton(nombre, url=url_rastreada(evento, url, f"video:{pid}:{nombre}"))])
     rows.append([InlineKeyboardButton("⬅️ Volver", callback_data=f"mat_pres:{pid}")])
     rows.append([InlineKeyboardButton("🏠 Menú principal", callback_data="volver_menu_principal")])
     return InlineKeyboardMarkup(rows)
@@ -368,25 +701,27 @@ def enlaces_inline_general() -> InlineKeyboardMarkup:
         [InlineKeyboardButton("⬅️ Volver", callback_data="volver_menu_principal")],
     ])
 
-def enlaces_presentador_lista(pid: str) -> InlineKeyboardMarkup:
-    enlaces = ENLACES_POR_PRESENTADOR.get(pid, {})
+def enlaces_presentador_lista(evento: Evento, pid: str) -> InlineKeyboardMarkup:
+    enlaces = evento.catalogo().enlaces.get(pid, {})
     rows = []
     for nombre, url in enlaces.items():
-        rows.append([InlineKeyboardButton(nombre, url=url)])
+        rows.append([InlineKeyboardButton(nombre, url=url_rastreada(evento, url, f"link:{pid}:{nombre}"))])
     rows.append([InlineKeyboardButton("⬅️ Elegir otro presentador", callback_data="enlaces_por_presentador")])
     rows.append([InlineKeyboardButton("🏠 Menú principal", callback_data="volver_menu_principal")])
     return InlineKeyboardMarkup(rows)
 
-def ubicacion_inline() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📍 Abrir en Google Maps", url=UBICACION_URL)],
-        [InlineKeyboardButton("⬅️ Volver", callback_data="volver_menu_principal")],
-    ])
+def ubicacion_inline(evento: Evento) -> InlineKeyboardMarkup:
+    rows = []
+    # Telegram rechaza un botón con url vacía: sin ubicación solo queda "Volver"
+    if evento.ubicacion_url:
+        rows.append([InlineKeyboardButton("📍 Abrir en Google Maps", url=url_rastreada(evento, evento.ubicacion_url, "ubicacion"))])
+    rows.append([InlineKeyboardButton("⬅️ Volver", callback_data="volver_menu_principal")])
+    return InlineKeyboardMarkup(rows)
 
-def exness_inline() -> InlineKeyboardMarkup:
+def exness_inline(evento: Evento) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("✅ Crear cuenta en Exness", url=EXNESS_ACCOUNT_URL)],
-        [InlineKeyboardButton("🤝 Conectar al Copy JP TACTICAL", url=EXNESS_COPY_URL)],
+        [InlineKeyboardButton("✅ Crear cuenta en Exness", url=url_rastreada(evento, EXNESS_ACCOUNT_URL, "exness:cuenta"))],
+        [InlineKeyboardButton("🤝 Conectar al Copy JP TACTICAL", url=url_rastreada(evento, EXNESS_COPY_URL, "exness:copy"))],
         [InlineKeyboardButton("⬅️ Volver", callback_data="volver_menu_principal")],
     ])
 
@@ -402,6 +737,7 @@ BTN_ENLACES = "🔗 Enlaces y Conexión"
 BTN_UBICACION = "📍 Ubicación"
 BTN_WIFI = "📶 Conectarme a la red"  # NUEVO
 BTN_CERRAR = "❌ Cerrar menú"
+BOTONES_TECLADO = {BTN_AGENDA, BTN_MATERIAL, BTN_ENLACES, BTN_UBICACION, BTN_WIFI, BTN_CERRAR}
 
 def bottom_keyboard() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
@@ -414,6 +750,408 @@ def bottom_keyboard() -> ReplyKeyboardMarkup:
         is_persistent=True,
     )
 
+# =========================
+# REINTENTOS (todas las llamadas a la API de Telegram)
+# =========================
+
+class CircuitoAbierto(NetworkError):
+    """Telegram viene fallando seguido: se rechaza la llamada sin intentarla."""
+
+class PoliticaReintentos:
+    """
+    Envoltorio común para las llamadas a Telegram:
+    - Reintenta TimedOut/NetworkError con backoff exponencial y jitter completo
+      (espera aleatoria entre 0 y base·2^n, con tope).
+    - RetryAfter (429) espera lo que pide Telegram solo si no supera el tope; si
+      no, falla de inmediato. Es control de flujo, no una caída: no cuenta para
+      el circuito.
+    - Los envíos que crean mensajes (reply_*/send_*, subidas) no se reintentan
+      si la conexión falló después de salir la petición (timeout o conexión
+      cortada al leer la respuesta): Telegram pudo haberlo recibido y el
+      reintento publicaría un duplicado. Sí se reintentan los fallos al
+      conectar, de pool o de escritura (la petición no llegó completa) y las
+      respuestas de error de Telegram (502 y similares).
+    - Presupuesto por llamada (intentos) y global (cubeta de reintentos que se
+      rellena cada ventana): durante una caída de Telegram no se acumulan miles
+      de corrutinas durmiendo para reintentar.
+    - Circuit breaker: tras N fallos seguidos, durante un tiempo se falla de
+      inmediato; pasada la espera, la siguiente llamada hace de prueba.
+    - "message is not modified" (clics repetidos sobre el mismo botón) se ignora.
+    """
+
+    def __init__(self, intentos: int, base: float, maximo: float, presupuesto: int, ventana: float,
+                 umbral_circuito: int, espera_circuito: float):
+        self.intentos = intentos
+        self.base = base
+        self.maximo = maximo
+        self.presupuesto = presupuesto
+        self.ventana = ventana
+        self.umbral_circuito = umbral_circuito
+        self.espera_circuito = espera_circuito
+        self._fichas = float(presupuesto)
+        self._ultima_recarga = time.monotonic()
+        self._fallos_seguidos = 0
+        self._abierto_hasta = 0.0
+        self.reintentos = 0
+        self.sin_presupuesto = 0
+        self.rechazadas = 0
+        self.no_modificados = 0
+        self.aperturas = 0
+        self.limitadas = 0
+        self.envios_sin_reintento = 0
+
+    @property
+    def circuito_abierto(self) -> bool:
+        return time.monotonic() < self._abierto_hasta
+
+    def _tomar_ficha(self) -> bool:
+        ahora = time.monotonic()
+        self._fichas = min(
+            self.presupuesto,
+            self._fichas + (ahora - self._ultima_recarga) * self.presupuesto / self.ventana,
+        )
+        self._ultima_recarga = ahora
+        if self._fichas < 1:
+            self.sin_presupuesto += 1
+            return False
+        self._fichas -= 1
+        return True
+
+    def _registrar_fallo(self):
+        self._fallos_seguidos += 1
+        if self._fallos_seguidos >= self.umbral_circuito and not self.circuito_abierto:
+            self._abierto_hasta = time.monotonic() + self.espera_circuito
+            self.aperturas += 1
+            logger.warning("Telegram: circuito abierto %.0fs tras %d fallos seguidos",
+                           self.espera_circuito, self._fallos_seguidos)
+
+    def _espera(self, intento: int) -> float:
+        return random.uniform(0, min(self.maximo, self.base * 2 ** (intento - 1)))
+
+    @staticmethod
+    def crea_mensaje(fn) -> bool:
+        nombre = getattr(fn, "__name__", "")
+        return nombre.startswith(("reply_", "send_")) and nombre not in {"send_action", "send_chat_action"}
+
+    @staticmethod
+    def fallo_antes_de_enviar(e: NetworkError) -> bool:
+        # PTB encadena la excepción de httpx: solo conexión/pool/escritura garantizan que no llegó
+        if isinstance(e.__cause__, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.WriteTimeout)):
+            return True
+        # Sin causa es una respuesta de error de Telegram (502...): no se publicó nada
+        return e.__cause__ is None and not isinstance(e, TimedOut)
+
+    async def llamar(self, fn, *args, intentos: Optional[int] = None, al_reintentar=None,
+                     envio: Optional[bool] = None, **kwargs):
+        """
+        await llamar(message.reply_text, "hola", reply_markup=...)
+        `al_reintentar(intento, intentos, espera)` (async, opcional) se llama antes de cada espera.
+        `envio`: si la llamada crea un mensaje; por defecto se deduce del nombre de `fn`.
+        """
+        if self.circuito_abierto:
+            self.rechazadas += 1
+            raise CircuitoAbierto("Telegram no responde; se reintentará más tarde")
+        intentos = intentos or self.intentos
+        if envio is None:
+            envio = self.crea_mensaje(fn)
+        for intento in range(1, intentos + 1):
+            try:
+                resultado = await fn(*args, **kwargs)
+            except BadRequest as e:
+                # BadRequest hereda de NetworkError pero no es transitorio
+                if "message is not modified" in e.message.lower():
+                    self.no_modificados += 1
+                    return None
+                raise
+            except RetryAfter as e:
+                espera = float(e.retry_after)
+                if espera > self.maximo:
+                    # Dormir decenas de segundos acumularía corrutinas: mejor fallar ya
+                    self.limitadas += 1
+                    raise
+                if intento == intentos or not self._tomar_ficha():
+                    raise
+            except (TimedOut, NetworkError) as e:
+                self._registrar_fallo()
+                if envio and not self.fallo_antes_de_enviar(e):
+                    self.envios_sin_reintento += 1
+                    raise
+                if intento == intentos or self.circuito_abierto or not self._tomar_ficha():
+                    raise
+                espera = self._espera(intento)
+            else:
+                self._fallos_seguidos = 0
+                return resultado
+            self.reintentos += 1
+            if al_reintentar is not None:
+                try:
+                    await al_reintentar(intento, intentos, espera)
+                except Exception:
+                    pass
+            await asyncio.sleep(espera)
+
+    def resumen(self) -> str:
+        estado = "abierto" if self.circuito_abierto else "cerrado"
+        return (
+            f"{self.reintentos} reintentos · {self.sin_presupuesto} sin presupuesto · "
+            f"{self.no_modificados} ediciones sin cambios · {self.limitadas} 429 sin esperar · "
+            f"{self.envios_sin_reintento} envíos cortados sin reintento · circuito {estado} "
+            f"({self.aperturas} aperturas, {self.rechazadas} rechazadas)"
+        )
+
+POLITICA_TG = PoliticaReintentos(
+    TG_INTENTOS, TG_BACKOFF_BASE, TG_BACKOFF_MAX,
+    TG_PRESUPUESTO_REINTENTOS, TG_PRESUPUESTO_VENTANA,
+    TG_CIRCUITO_FALLOS, TG_CIRCUITO_ESPERA,
+)
+
+async def llamar_tg(fn, *args, **kwargs):
+    acumulado = _TIEMPO_TG.get()
+    if acumulado is None:
+        return await POLITICA_TG.llamar(fn, *args, **kwargs)
+    t0 = time.perf_counter()
+    try:
+        return await POLITICA_TG.llamar(fn, *args, **kwargs)
+    finally:
+        acumulado[0] += time.perf_counter() - t0
+
+# =========================
+# MÉTRICAS EN VIVO (agregados O(1) en el hot path)
+# =========================
+
+class VentanaDeslizante:
+    """Suma de los últimos `segundos` en cubetas de 1 s; sumar es O(1)."""
+
+    def __init__(self, segundos: int = 60):
+        self.segundos = segundos
+        self._cubos = [0] * segundos
+        self._marcas = [0] * segundos
+
+    def sumar(self, n: int = 1):
+        seg = int(time.monotonic())
+        i = seg % self.segundos
+        if self._marcas[i] != seg:
+            self._marcas[i] = seg
+            self._cubos[i] = 0
+        self._cubos[i] += n
+
+    def total(self) -> int:
+        desde = int(time.monotonic()) - self.segundos
+        return sum(c for c, m in zip(self._cubos, self._marcas) if m > desde)
+
+    def por_segundo(self) -> float:
+        return self.total() / self.segundos
+
+class ActividadReciente:
+    """Usuarios autenticados con actividad en los últimos `segundos` (LRU por orden de llegada)."""
+
+    def __init__(self, segundos: float):
+        self.segundos = segundos
+        self._visto: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+
+    def tocar(self, clave: Tuple[str, int]):
+        self._visto[clave] = time.monotonic()
+        self._visto.move_to_end(clave)
+        self._expirar()
+
+    def _expirar(self):
+        limite = time.monotonic() - self.segundos
+        while self._visto:
+            clave, ts = next(iter(self._visto.items()))
+            if ts >= limite:
+                break
+            self._visto.popitem(last=False)
+
+    def __len__(self) -> int:
+        self._expirar()
+        return len(self._visto)
+
+class CacheArchivos:
+    """
+    file_id de Telegram por (bot, archivo local): tras la primera subida se reenvía
+    sin volver a subirlo. Un file_id solo vale para el bot que lo recibió, por eso
+    cada evento tiene sus propias entradas.
+    """
+
+    def __init__(self):
+        self._ids: Dict[Tuple[str, Path], str] = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self.vencidos = 0
+
+    def obtener(self, token: str, ruta: Path) -> Optional[str]:
+        file_id = self._ids.get((token, ruta))
+        if file_id is None:
+            self.fallos += 1
+        else:
+            self.aciertos += 1
+        return file_id
+
+    def guardar(self, token: str, ruta: Path, file_id: str):
+        self._ids[(token, ruta)] = file_id
+
+    def vencido(self, token: str, ruta: Path):
+        """Telegram rechazó el file_id: se olvida y el acierto pasa a contar como fallo."""
+        self._ids.pop((token, ruta), None)
+        self.aciertos -= 1
+        self.fallos += 1
+        self.vencidos += 1
+
+    def limpiar(self, token: str) -> int:
+        """Olvida los file_id de un bot; los de los otros eventos siguen valiendo."""
+        propios = [clave for clave in self._ids if clave[0] == token]
+        for clave in propios:
+            del self._ids[clave]
+        return len(propios)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def ratio(self) -> float:
+        total = self.aciertos + self.fallos
+        return self.aciertos / total if total else 0.0
+
+class MetricasEnVivo:
+    def __init__(self):
+        self.updates = VentanaDeslizante(60)
+        self.errores = VentanaDeslizante(60)
+        self.errores_total = 0
+        self.sesiones = ActividadReciente(SESION_ACTIVA_MIN * 60)
+        self.materiales: Counter = Counter()
+        self.handlers_lentos = 0
+
+EN_VIVO = MetricasEnVivo()
+CACHE_ARCHIVOS = CacheArchivos()
+
+# =========================
+# PERFILADO (handlers lentos, muestreo del event loop, bloqueos)
+# =========================
+
+# Tiempo acumulado en llamadas a Telegram dentro del update actual (cada update corre en su propia tarea)
+_TIEMPO_TG: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar("tiempo_tg", default=None)
+
+def ruta_de(update: object) -> str:
+    if isinstance(update, Update):
+        if update.callback_query:
+            return f"callback_data={update.callback_query.data!r}"
+        if update.message and update.message.text:
+            texto = update.message.text
+            # Solo comandos y botones del teclado: nunca cédulas/correos
+            return texto.split()[0] if texto.startswith("/") else ("botón " + texto if texto in BOTONES_TECLADO else "texto")
+    return type(update).__name__
+
+def cronometrado(fn):
+    """
+    Mide cada handler y separa el tiempo en Telegram (llamar_tg) del resto
+    (código propio, disco). Loguea los que superan SLOW_HANDLER_MS.
+    """
+    if SLOW_HANDLER_MS <= 0:
+        return fn
+
+    @wraps(fn)
+    async def envoltura(update, context):
+        acumulado = [0.0]
+        token = _TIEMPO_TG.set(acumulado)
+        t0 = time.perf_counter()
+        try:
+            return await fn(update, context)
+        finally:
+            total_ms = (time.perf_counter() - t0) * 1000
+            _TIEMPO_TG.reset(token)
+            if total_ms >= SLOW_HANDLER_MS:
+                EN_VIVO.handlers_lentos += 1
+                tg_ms = acumulado[0] * 1000
+                logger.warning(
+                    "Handler lento: %s %.0f ms (Telegram %.0f ms, resto %.0f ms) %s",
+                    fn.__name__, total_ms, tg_ms, total_ms - tg_ms, ruta_de(update),
+                )
+    return envoltura
+
+def muestrear_pila(thread_id: int, segundos: float, intervalo: float) -> Counter:
+    """
+    Perfilador por muestreo: cada `intervalo` s toma la pila del hilo del event
+    loop y la cuenta en formato "collapsed" (a;b;c N), listo para flamegraph.pl
+    o speedscope. Corre en otro hilo, así que no frena al loop.
+    """
+    pilas: Counter = Counter()
+    fin = time.monotonic() + segundos
+    while time.monotonic() < fin:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            marcos = traceback.extract_stack(frame)
+            pilas[";".join(f"{Path(m.filename).name}:{m.name}" for m in marcos)] += 1
+        time.sleep(intervalo)
+    return pilas
+
+class MonitorLoop:
+    """
+    Detecta bloqueos del event loop (p.ej. un Path.exists() o un open() síncrono
+    sobre un disco lento). Una tarea del loop marca un latido cada intervalo;
+    un hilo vigía revisa el latido y, si se atrasó más de `umbral` s, captura la
+    pila del hilo del loop en ese momento y la loguea una vez por bloqueo.
+    """
+
+    def __init__(self, umbral: float):
+        self.umbral = umbral
+        self.intervalo = max(umbral / 4, 0.01)
+        self.lag_max_ms = 0.0
+        self.bloqueos = 0
+        self._latido = time.monotonic()
+        self._tarea: Optional[asyncio.Task] = None
+        self._hilo: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+        self._thread_id = 0
+
+    @property
+    def activo(self) -> bool:
+        return self.umbral > 0
+
+    async def _latir(self):
+        while True:
+            antes = time.monotonic()
+            self._latido = antes
+            await asyncio.sleep(self.intervalo)
+            lag_ms = (time.monotonic() - antes - self.intervalo) * 1000
+            self.lag_max_ms = max(self.lag_max_ms, lag_ms)
+
+    def _vigilar(self):
+        reportado = False
+        while not self._parar.wait(self.intervalo):
+            atraso = time.monotonic() - self._latido
+            if atraso < self.umbral + self.intervalo:
+                reportado = False
+                continue
+            if reportado:
+                continue
+            reportado = True
+            self.bloqueos += 1
+            frame = sys._current_frames().get(self._thread_id)
+            pila = "".join(traceback.format_stack(frame)) if frame is not None else "(sin pila)"
+            logger.warning("Event loop bloqueado %.0f ms. Pila del loop:\n%s", atraso * 1000, pila)
+
+    async def iniciar(self):
+        if not self.activo or self._tarea is not None:
+            return
+        self._thread_id = threading.get_ident()
+        self._latido = time.monotonic()
+        self._tarea = asyncio.create_task(self._latir())
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._vigilar, name="monitor-loop", daemon=True)
+        self._hilo.start()
+
+    async def detener(self):
+        if self._tarea is None:
+            return
+        self._parar.set()
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+
+MONITOR_LOOP = MonitorLoop(LOOP_LAG_MS / 1000)
+
 # =========================
 # HELPERS
 # =========================
@@ -435,98 +1173,619 @@ async def envia_documento(upd_or_q, context: ContextTypes.DEFAULT_TYPE, ruta: Pa
         chat = q.message.chat
         message = q.message
 
-    if not ruta.exists():
-        await message.reply_text(f"⚠️ No encuentro el archivo: {nombre_mostrar}")
-        return
-
+    EN_VIVO.materiales[nombre_mostrar] += 1
     ext = ruta.suffix.lower()
     es_video = ext in {".mp4", ".mov", ".m4v"}
 
+    # Ya subido antes: se reenvía por file_id, sin leer el disco ni volver a subir
+    token = context.bot.token
+    file_id = CACHE_ARCHIVOS.obtener(token, ruta)
+    if file_id:
+        try:
+            if es_video:
+                await llamar_tg(message.reply_video, video=file_id, caption=nombre_mostrar, supports_streaming=True)
+            else:
+                await llamar_tg(message.reply_document, document=file_id, caption=nombre_mostrar)
+            await llamar_tg(message.reply_text, "¿Qué deseas hacer ahora?", reply_markup=principal_inline())
+            return
+        except BadRequest:
+            CACHE_ARCHIVOS.vencido(token, ruta)  # file_id inválido: se sube de nuevo
+
+    if not archivo_existe(ruta):
+        await llamar_tg(message.reply_text, f"⚠️ No encuentro el archivo: {nombre_mostrar}")
+        return
+
     action = ChatAction.UPLOAD_VIDEO if es_video else ChatAction.UPLOAD_DOCUMENT
     texto_espera = "⏳ Preparando y enviando el video… puede tardar unos minutos." if es_video \
                    else "⏳ Preparando y enviando el archivo…"
 
-    await chat.send_action(action=action)
-    aviso = await message.reply_text(texto_espera)
+    await llamar_tg(chat.send_action, action=action)
+    aviso = await llamar_tg(message.reply_text, texto_espera)
 
     READ_T = 600
     WRITE_T = 600
-    intentos = 3
 
-    for i in range(1, intentos + 1):
-        try:
-            with ruta.open("rb") as f:
-                if es_video:
-                    await message.reply_video(
-                        video=InputFile(f, filename=ruta.name),
-                        caption=nombre_mostrar,
-                        supports_streaming=True,
-                        read_timeout=READ_T,
-                        write_timeout=WRITE_T,
-                    )
-                else:
-                    await message.reply_document(
-                        document=InputFile(f, filename=ruta.name),
-                        caption=nombre_mostrar,
-                        read_timeout=READ_T,
-                        write_timeout=WRITE_T,
-                    )
-            await aviso.edit_text("✅ Archivo enviado.")
-            await message.reply_text("¿Qué deseas hacer ahora?", reply_markup=principal_inline())
-            return
+    async def subir():
+        # Se abre el archivo en cada intento: un reintento no puede reusar el stream ya leído
+        with ruta.open("rb") as f:
+            if es_video:
+                return await message.reply_video(
+                    video=InputFile(f, filename=ruta.name),
+                    caption=nombre_mostrar,
+                    supports_streaming=True,
+                    read_timeout=READ_T,
+                    write_timeout=WRITE_T,
+                )
+            return await message.reply_document(
+                document=InputFile(f, filename=ruta.name),
+                caption=nombre_mostrar,
+                read_timeout=READ_T,
+                write_timeout=WRITE_T,
+            )
 
-        except (TimedOut, NetworkError) as e:
-            if i < intentos:
-                espera = 2 ** i
+    async def avisar_reintento(i: int, total: int, espera: float):
+        await aviso.edit_text(f"⚠️ Conexión inestable, reintentando en {espera:.1f}s… (intento {i}/{total})")
+
+    try:
+        enviado = await llamar_tg(subir, intentos=TG_INTENTOS_SUBIDA, al_reintentar=avisar_reintento, envio=True)
+    except (TimedOut, NetworkError) as e:
+        if isinstance(e, BadRequest):
+            await llamar_tg(aviso.edit_text, f"❌ Error al enviar el archivo: {e}")
+        else:
+            await llamar_tg(aviso.edit_text, f"❌ No se pudo enviar el archivo por tiempo de espera agotado.\nDetalle: {e}")
+        return
+    except Exception as e:
+        await llamar_tg(aviso.edit_text, f"❌ Error al enviar el archivo: {e}")
+        return
+
+    adjunto = enviado.video if es_video else enviado.document
+    if adjunto is not None:
+        CACHE_ARCHIVOS.guardar(token, ruta, adjunto.file_id)
+    await llamar_tg(aviso.edit_text, "✅ Archivo enviado.")
+    await llamar_tg(message.reply_text, "¿Qué deseas hacer ahora?", reply_markup=principal_inline())
+
+# =========================
+# ANALÍTICA (buffer en memoria + escritura por lotes)
+# =========================
+
+def abrir_conexion_sql(url: str):
+    """
+    Devuelve (conexión, marcador) para Postgres (postgres://...) o SQLite
+    (sqlite:///ruta.db o una ruta simple). El marcador es el placeholder de parámetros.
+    """
+    if url.startswith(("postgres://", "postgresql://")):
+        import psycopg2  # solo se requiere si se usa Postgres
+        conn = psycopg2.connect(url)
+        return conn, "%s"
+    ruta = url[len("sqlite:///"):] if url.startswith("sqlite:///") else url
+    Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+    # La conexión se usa desde el hilo de asyncio.to_thread, no desde el loop
+    return sqlite3.connect(ruta, check_same_thread=False), "?"
+
+class ConexionSQL:
+    """Conexión compartida (analítica + persistencia de todos los eventos) con su lock."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.conn, self.ph = abrir_conexion_sql(url)
+        self.lock = threading.Lock()  # se usa desde hilos de asyncio.to_thread
+        self.reconexiones = 0
+
+    def transaccion(self, fn):
+        """
+        Corre fn(cursor) con el lock tomado y hace commit. Si falla hace rollback:
+        en Postgres una sentencia fallida deja la transacción abortada y, como la
+        conexión es compartida, todo lo que viniera después fallaría también. Si
+        la conexión se cayó (OperationalError/InterfaceError) se reabre para la
+        próxima llamada. El error se propaga igual.
+        """
+        with self.lock:
+            try:
+                cur = self.conn.cursor()
+                resultado = fn(cur)
+                self.conn.commit()
+                return resultado
+            except Exception as e:
                 try:
-                    await aviso.edit_text(f"⚠️ Conexión inestable, reintentando en {espera}s… (intento {i}/{intentos})")
+                    self.conn.rollback()
                 except Exception:
                     pass
-                await asyncio.sleep(espera)
+                # Por nombre: sqlite3 y psycopg2 definen sus propias clases
+                if type(e).__name__ in {"OperationalError", "InterfaceError"}:
+                    self._reabrir()
+                raise
+
+    def _reabrir(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        try:
+            self.conn, self.ph = abrir_conexion_sql(self.url)
+            self.reconexiones += 1
+            logger.warning("SQL: conexión reabierta tras un error de conexión")
+        except Exception:
+            # Se reintenta en la próxima transacción (la conexión cerrada falla con InterfaceError)
+            logger.exception("SQL: no se pudo reabrir la conexión")
+
+_CONEXIONES: Dict[str, ConexionSQL] = {}
+_CONEXIONES_LOCK = threading.Lock()
+
+def conexion_compartida(url: str) -> ConexionSQL:
+    with _CONEXIONES_LOCK:
+        if url not in _CONEXIONES:
+            _CONEXIONES[url] = ConexionSQL(url)
+        return _CONEXIONES[url]
+
+def cerrar_conexiones():
+    with _CONEXIONES_LOCK:
+        for c in _CONEXIONES.values():
+            c.conn.close()
+        _CONEXIONES.clear()
+
+class EscritorJSONL:
+    """Escribe lotes de eventos en data/analytics/eventos.jsonl con rotación por tamaño."""
+
+    def __init__(self, directorio: Path, max_bytes: int, backups: int):
+        self.ruta = directorio / "eventos.jsonl"
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def _rotar(self):
+        for i in range(self.backups - 1, 0, -1):
+            origen = self.ruta.with_name(f"{self.ruta.name}.{i}")
+            if origen.exists():
+                origen.replace(self.ruta.with_name(f"{self.ruta.name}.{i + 1}"))
+        self.ruta.replace(self.ruta.with_name(f"{self.ruta.name}.1"))
+
+    def escribir(self, lote: List[dict]):
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        lineas = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in lote)
+        with self.ruta.open("a", encoding="utf-8") as f:
+            f.write(lineas)
+        if self.backups > 0 and self.ruta.stat().st_size >= self.max_bytes:
+            self._rotar()
+
+    def cerrar(self):
+        pass
+
+class EscritorSQL:
+    """Inserta lotes de eventos en la tabla analytics_eventos (SQLite o Postgres)."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._db: Optional[ConexionSQL] = None
+
+    def _conectar(self) -> ConexionSQL:
+        if self._db is None:
+            db = conexion_compartida(self.url)
+            db.transaccion(lambda cur: cur.execute(
+                "CREATE TABLE IF NOT EXISTS analytics_eventos ("
+                "ts DOUBLE PRECISION, tipo TEXT, user_id BIGINT, clave TEXT, extra TEXT)"
+            ))
+            self._db = db
+        return self._db
+
+    def escribir(self, lote: List[dict]):
+        db = self._conectar()
+        filas = [
+            (e["ts"], e["tipo"], e["user_id"], e["clave"], json.dumps(e.get("extra") or {}, ensure_ascii=False))
+            for e in lote
+        ]
+        ph = db.ph
+        db.transaccion(lambda cur: cur.executemany(
+            f"INSERT INTO analytics_eventos (ts, tipo, user_id, clave, extra) VALUES ({ph}, {ph}, {ph}, {ph}, {ph})",
+            filas,
+        ))
+
+    def cerrar(self):
+        self._db = None  # la conexión es compartida; se cierra con cerrar_conexiones()
+
+class Analitica:
+    """
+    Registro de eventos sin I/O en los handlers.
+    - registrar() solo agrega a un deque acotado (si se llena, se descarta el más viejo).
+    - Una tarea en segundo plano vacía el buffer por lotes cada ANALYTICS_INTERVALO
+      segundos, o antes si ya hay un lote completo.
+    - Los contadores agregados (para /estadisticas) se mantienen en memoria.
+    """
+
+    def __init__(self, escritor, capacidad: int, lote: int, intervalo: float):
+        self.escritor = escritor
+        self.lote = lote
+        self.intervalo = intervalo
+        self._buffer: deque = deque(maxlen=capacidad)
+        self._hay_lote = asyncio.Event()
+        self._tarea: Optional[asyncio.Task] = None
+        self.totales: Counter = Counter()
+        self.por_clave: Counter = Counter()
+        self.escritos = 0
+        self.descartados = 0
+        self.fallos = 0
+
+    @property
+    def activa(self) -> bool:
+        return self.escritor is not None
+
+    @property
+    def pendientes(self) -> int:
+        return len(self._buffer)
+
+    def registrar(self, tipo: str, user_id: int = 0, clave: str = "", **extra):
+        if not self.activa:
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            self.descartados += 1  # backpressure: se pierde el evento más viejo
+        self._buffer.append({
+            "ts": time.time(),
+            "tipo": tipo,
+            "user_id": user_id,
+            "clave": clave,
+            "extra": extra,
+        })
+        self.totales[tipo] += 1
+        if clave:
+            self.por_clave[(tipo, clave)] += 1
+        if len(self._buffer) >= self.lote:
+            self._hay_lote.set()
+
+    async def vaciar(self):
+        while self._buffer:
+            n = min(self.lote, len(self._buffer))
+            lote = [self._buffer.popleft() for _ in range(n)]
+            try:
+                await asyncio.to_thread(self.escritor.escribir, lote)
+                self.escritos += n
+            except Exception:
+                self.fallos += 1
+                self.descartados += n
+                logger.exception("Analítica: no se pudo escribir un lote de %d eventos", n)
+                return
+
+    async def _bucle(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._hay_lote.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._hay_lote.clear()
+            await self.vaciar()
+
+    async def iniciar(self):
+        if self.activa and self._tarea is None:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        if self.activa:
+            await self.vaciar()
+            await asyncio.to_thread(self.escritor.cerrar)
+
+    def top(self, tipo: str, prefijo: str = "", n: int = 10) -> List[Tuple[str, int]]:
+        items = [(clave, c) for (t, clave), c in self.por_clave.items() if t == tipo and clave.startswith(prefijo)]
+        items.sort(key=lambda x: x[1], reverse=True)
+        return items[:n]
+
+def crear_escritor_analitica():
+    if ANALYTICS_BACKEND == "jsonl":
+        return EscritorJSONL(ANALYTICS_DIR, ANALYTICS_JSONL_MAX_BYTES, ANALYTICS_JSONL_BACKUPS)
+    if ANALYTICS_BACKEND in {"sqlite", "postgres"}:
+        url = ANALYTICS_DB_URL or f"sqlite:///{ANALYTICS_DIR / 'analytics.db'}"
+        return EscritorSQL(url)
+    return None  # "off" o valor desconocido → analítica deshabilitada
+
+ANALITICA = Analitica(crear_escritor_analitica(), ANALYTICS_BUFFER, ANALYTICS_LOTE, ANALYTICS_INTERVALO)
+
+# =========================
+# REDIRECCIONES (clics en botones con URL)
+# =========================
+
+class Redirecciones:
+    """
+    Los botones con url=... no generan callback, así que no sabemos si se tocan.
+    Con REDIRECT_ENABLED, cada URL se reemplaza por un enlace corto firmado
+    (/r/<codigo>) que sirve el mismo puerto del webhook y redirige al destino.
+    Solo en MODO_WEBHOOK: en polling no hay servidor web que atienda /r/.
+    - El código es un HMAC determinista de (etiqueta, url): es estable entre
+      reinicios, así que los teclados viejos siguen funcionando.
+    - Los códigos se generan al construir los teclados; la redirección es solo
+      un dict lookup + un contador en memoria.
+    - Los conteos se persisten periódicamente como eventos de ANALITICA.
+    """
+
+    def __init__(self, habilitado: bool, base_url: str, secreto: str, intervalo: float):
+        self.habilitado = habilitado and bool(base_url)
+        self.base_url = base_url
+        self._secreto = secreto.encode()
+        self.intervalo = intervalo
+        self._por_destino: Dict[Tuple[str, str], str] = {}   # (url, etiqueta) -> url corta
+        self._por_codigo: Dict[str, Tuple[str, str]] = {}    # codigo -> (url, etiqueta)
+        self.clics: Counter = Counter()                      # etiqueta -> total
+        self._sin_persistir: Counter = Counter()
+        self._tarea: Optional[asyncio.Task] = None
+
+    def _codigo(self, url: str, etiqueta: str) -> str:
+        firma = hmac.new(self._secreto, f"{etiqueta}\n{url}".encode(), hashlib.sha256).digest()[:8]
+        return base64.urlsafe_b64encode(firma).rstrip(b"=").decode()
+
+    def url(self, destino: str, etiqueta: str) -> str:
+        # Enlaces sin esquema (p.ej. "wa.me/...") no se pueden redirigir de forma segura
+        if not self.habilitado or not destino.startswith(("http://", "https://")):
+            return destino
+        corta = self._por_destino.get((destino, etiqueta))
+        if corta is None:
+            codigo = self._codigo(destino, etiqueta)
+            self._por_codigo[codigo] = (destino, etiqueta)
+            corta = f"{self.base_url}/r/{codigo}"
+            self._por_destino[(destino, etiqueta)] = corta
+        return corta
+
+    def resolver(self, codigo: str) -> Optional[str]:
+        entrada = self._por_codigo.get(codigo)
+        if entrada is None:
+            return None
+        destino, etiqueta = entrada
+        self.clics[etiqueta] += 1
+        self._sin_persistir[etiqueta] += 1
+        return destino
+
+    def persistir(self):
+        for etiqueta, n in self._sin_persistir.items():
+            ANALITICA.registrar("clic_url", 0, etiqueta, n=n)
+        self._sin_persistir.clear()
+
+    async def _bucle(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            self.persistir()
+
+    async def iniciar(self):
+        if self.habilitado and self._tarea is None:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        self.persistir()
+
+REDIRECCIONES = Redirecciones(
+    REDIRECT_ENABLED and MODO_WEBHOOK, REDIRECT_BASE_URL, REDIRECT_SECRET, REDIRECT_PERSIST_INTERVALO
+)
+
+def url_rastreada(evento: Evento, destino: str, etiqueta: str) -> str:
+    # Con varios eventos, la etiqueta lleva el código para separar los clics por evento
+    return REDIRECCIONES.url(destino, f"{evento.codigo}:{etiqueta}" if evento.codigo else etiqueta)
+
+def precargar_redirecciones(evento: Evento):
+    """Genera los enlaces cortos de todos los teclados con URL antes de recibir tráfico."""
+    if not REDIRECCIONES.habilitado:
+        return
+    for pid, _ in evento.catalogo().presentadores:
+        lista_video_links_inline(evento, pid)
+        enlaces_presentador_lista(evento, pid)
+    ubicacion_inline(evento)
+    exness_inline(evento)
+
+# =========================
+# PERSISTENCIA (user_data / chat_data / bot_data en SQL)
+# =========================
+
+class PersistenciaSQL(BasePersistence):
+    """
+    Persistencia de PTB sobre SQLite o Postgres (tabla ptb_datos).
+    - Todo se lee una sola vez al arrancar.
+    - PTB llama update_*/drop_* cada `update_interval` segundos solo para los
+      usuarios/chats que cambiaron; aquí esas llamadas solo marcan datos sucios
+      y una única tarea los escribe en un lote (un upsert por fila, una transacción).
+    - Los valores se guardan con pickle, igual que PicklePersistence.
+    """
+
+    def __init__(self, url: str, update_interval: float = 60, espacio: str = ""):
+        super().__init__(store_data=PersistenceInput(), update_interval=update_interval)
+        self.url = url
+        self.espacio = espacio  # código del evento: separa las filas de cada evento en la misma tabla
+        self._db: Optional[ConexionSQL] = None
+        self._cargado: Optional[Dict[Tuple[str, str], Any]] = None
+        self._sucios: Dict[Tuple[str, str], Any] = {}   # (tipo, clave) -> datos (None = borrar)
+        self._escritura: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.lotes_escritos = 0
+        self.filas_descartadas = 0
+
+    # --- SQL (se ejecuta en asyncio.to_thread) ---
+
+    def _conectar(self) -> ConexionSQL:
+        if self._db is None:
+            db = conexion_compartida(self.url)
+            tipo_blob = "BYTEA" if db.ph == "%s" else "BLOB"
+            db.transaccion(lambda cur: cur.execute(
+                f"CREATE TABLE IF NOT EXISTS ptb_datos ("
+                f"tipo TEXT NOT NULL, clave TEXT NOT NULL, datos {tipo_blob}, PRIMARY KEY (tipo, clave))"
+            ))
+            self._db = db
+        return self._db
+
+    def _tipo_sql(self, tipo: str) -> str:
+        return f"{self.espacio}/{tipo}" if self.espacio else tipo
+
+    def _leer_todo(self) -> Dict[Tuple[str, str], Any]:
+        db = self._conectar()
+
+        def leer(cur):
+            cur.execute("SELECT tipo, clave, datos FROM ptb_datos")
+            return cur.fetchall()
+        filas = db.transaccion(leer)
+        prefijo = f"{self.espacio}/" if self.espacio else ""
+        datos = {}
+        for tipo, clave, blob in filas:
+            if prefijo and not tipo.startswith(prefijo):
                 continue
-            else:
-                await aviso.edit_text(f"❌ No se pudo enviar el archivo por tiempo de espera agotado.\nDetalle: {e}")
+            if not prefijo and "/" in tipo:
+                continue  # fila de otro evento
+            try:
+                datos[(tipo[len(prefijo):], clave)] = pickle.loads(bytes(blob))
+            except Exception:
+                # Una fila corrupta o de una clase que ya no existe no debe impedir el arranque
+                self.filas_descartadas += 1
+                logger.warning("Persistencia: se descarta la fila (%s, %s) que no se pudo leer", tipo, clave, exc_info=True)
+        return datos
+
+    def _escribir_lote(self, lote: Dict[Tuple[str, str], Any]):
+        db = self._conectar()
+        ph = db.ph
+        upserts = [(self._tipo_sql(t), c, pickle.dumps(d)) for (t, c), d in lote.items() if d is not None]
+        borrados = [(self._tipo_sql(t), c) for (t, c), d in lote.items() if d is None]
+
+        def escribir(cur):
+            if upserts:
+                cur.executemany(
+                    f"INSERT INTO ptb_datos (tipo, clave, datos) VALUES ({ph}, {ph}, {ph}) "
+                    f"ON CONFLICT (tipo, clave) DO UPDATE SET datos = excluded.datos",
+                    upserts,
+                )
+            if borrados:
+                cur.executemany(f"DELETE FROM ptb_datos WHERE tipo = {ph} AND clave = {ph}", borrados)
+        db.transaccion(escribir)
+
+    # --- coalescencia de escrituras ---
+
+    async def _datos(self) -> Dict[Tuple[str, str], Any]:
+        if self._cargado is None:
+            self._cargado = await asyncio.to_thread(self._leer_todo)
+        return self._cargado
+
+    def _marcar(self, tipo: str, clave, datos):
+        self._sucios[(tipo, str(clave))] = datos
+        # PTB lanza todos los update_* de una ronda juntos; la tarea corre cuando terminan
+        if self._escritura is None or self._escritura.done():
+            self._escritura = asyncio.create_task(self._vaciar())
+
+    async def _vaciar(self):
+        async with self._lock:
+            if not self._sucios:
                 return
-        except Exception as e:
-            await aviso.edit_text(f"❌ Error al enviar el archivo: {e}")
-            return
+            lote, self._sucios = self._sucios, {}
+            try:
+                await asyncio.to_thread(self._escribir_lote, lote)
+                self.lotes_escritos += 1
+            except Exception:
+                logger.exception("Persistencia: no se pudo escribir un lote de %d filas", len(lote))
+                lote.update(self._sucios)  # se reintenta en la próxima ronda
+                self._sucios = lote
+
+    # --- interfaz BasePersistence ---
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {int(c): d for (t, c), d in (await self._datos()).items() if t == "user"}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {int(c): d for (t, c), d in (await self._datos()).items() if t == "chat"}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return (await self._datos()).get(("bot", ""), {})
+
+    async def get_callback_data(self):
+        return (await self._datos()).get(("callback", ""))
+
+    async def get_conversations(self, name: str):
+        return (await self._datos()).get(("conv", name), {})
+
+    async def update_user_data(self, user_id: int, data) -> None:
+        self._marcar("user", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        self._marcar("chat", chat_id, data)
+
+    async def update_bot_data(self, data) -> None:
+        self._marcar("bot", "", data)
+
+    async def update_callback_data(self, data) -> None:
+        self._marcar("callback", "", data)
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        convs = dict((await self._datos()).get(("conv", name), {}))
+        if new_state is None:
+            convs.pop(key, None)
+        else:
+            convs[key] = new_state
+        self._cargado[("conv", name)] = convs
+        self._marcar("conv", name, convs)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._marcar("user", user_id, None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._marcar("chat", chat_id, None)
+
+    async def refresh_user_data(self, user_id: int, user_data) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        if self._escritura is not None:
+            await self._escritura
+        await self._vaciar()
+        # La conexión es compartida entre eventos; se cierra con cerrar_conexiones()
 
 # =========================
 # MIDDLEWARE: VALIDACIÓN
 # =========================
 
-@dataclass
-class PerfilUsuario:
-    nombre: str
-    autenticado: bool = False
+# El perfil vive en context.user_data["perfil"] como dict simple {"nombre", "autenticado"}
+# (persistido por PersistenciaSQL si está configurada). Un dict se lee con pickle sin
+# depender de cómo se importó este módulo (__main__ vs app).
+def perfil_de(context: ContextTypes.DEFAULT_TYPE) -> Optional[Dict[str, Any]]:
+    return context.user_data.get("perfil") if context.user_data is not None else None
 
-# Guardaremos por user_id un dict con su perfil
-PERFILES: Dict[int, PerfilUsuario] = {}
+def esta_autenticado(context: ContextTypes.DEFAULT_TYPE) -> bool:
+    perfil = perfil_de(context)
+    return bool(perfil and perfil.get("autenticado"))
 
 async def ensure_auth(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Tuple[bool, int]:
     user_id = update.effective_user.id if update.effective_user else 0
-    perfil = PERFILES.get(user_id)
-    return (perfil is not None and perfil.autenticado), user_id
+    return esta_autenticado(context), user_id
+
+def es_admin(update: Update) -> bool:
+    return bool(update.effective_user) and update.effective_user.id in ADMIN_IDS
 
 # =========================
 # HANDLERS
 # =========================
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    evento = evento_de(context)
     # Modo pre-lanzamiento
-    en_pre, msg = esta_en_prelanzamiento()
+    en_pre, msg = esta_en_prelanzamiento(evento)
     if en_pre:
-        await update.message.reply_text(msg)
+        await llamar_tg(update.message.reply_text, msg)
         return
 
-    await update.message.reply_text(
-        f"👋 Hola, este es el bot del {NOMBRE_EVENTO}.\n\n"
+    await llamar_tg(
+        update.message.reply_text,
+        f"👋 Hola, este es el bot del {evento.nombre}.\n\n"
         "Para continuar, por favor escribe tu **cédula** o **correo registrado**:",
         reply_markup=bottom_keyboard()
     )
 
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
+    await llamar_tg(
+        update.message.reply_text,
         "/start - Iniciar/validar acceso\n"
         "/menu - Mostrar menú\n"
         "/help - Ayuda\n"
@@ -536,15 +1795,16 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def menu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     autenticado, _ = await ensure_auth(update, context)
     if not autenticado:
-        await update.message.reply_text("⚠️ Debes validarte primero. Escribe tu **cédula** o **correo**.")
+        await llamar_tg(update.message.reply_text, "⚠️ Debes validarte primero. Escribe tu **cédula** o **correo**.")
         return
-    await update.message.reply_text("Menú principal:", reply_markup=principal_inline())
+    await llamar_tg(update.message.reply_text, "Menú principal:", reply_markup=principal_inline())
 
 async def text_ingreso_o_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    evento = evento_de(context)
     # Si aún estamos en pre-lanzamiento, no permitir flujos
-    en_pre, msg = esta_en_prelanzamiento()
+    en_pre, msg = esta_en_prelanzamiento(evento)
     if en_pre:
-        await update.message.reply_text(msg)
+        await llamar_tg(update.message.reply_text, msg)
         return
 
     autenticado, user_id = await ensure_auth(update, context)
@@ -552,18 +1812,21 @@ async def text_ingreso_o_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     # Si ya está autenticado, procesar botones del teclado persistente
     if autenticado:
+        ANALITICA.registrar("texto", user_id, texto if texto in BOTONES_TECLADO else "", evento=evento.codigo)
         if texto == BTN_AGENDA:
             await accion_agenda(update, context)
             return
         if texto == BTN_MATERIAL:
-            await update.message.reply_text(
+            await llamar_tg(
+                update.message.reply_text,
                 "📚 *Material de apoyo*\nElige un presentador:",
-                reply_markup=presentadores_keyboard("mat_pres"),
+                reply_markup=presentadores_keyboard(evento, "mat_pres"),
                 parse_mode="Markdown",
             )
             return
         if texto == BTN_ENLACES:
-            await update.message.reply_text(
+            await llamar_tg(
+                update.message.reply_text,
                 "🔗 *Enlaces y Conexión*",
                 reply_markup=enlaces_inline_general(),
                 parse_mode="Markdown",
@@ -576,32 +1839,39 @@ async def text_ingreso_o_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
             await accion_wifi(update, context)
             return
         if texto == BTN_CERRAR:
-            await update.message.reply_text(
+            await llamar_tg(
+                update.message.reply_text,
                 "Menú ocultado. Usa /menu para mostrarlo de nuevo.",
                 reply_markup=ReplyKeyboardRemove()
             )
             return
 
-        await update.message.reply_text("Estás autenticado. Usa el menú:", reply_markup=principal_inline())
+        await llamar_tg(update.message.reply_text, "Estás autenticado. Usa el menú:", reply_markup=principal_inline())
         return
 
     # NO autenticado → validar credencial
     clave = normaliza(texto)
     if not clave:
-        await update.message.reply_text("❗ Por favor escribe tu **cédula** o **correo**.")
+        await llamar_tg(update.message.reply_text, "❗ Por favor escribe tu **cédula** o **correo**.")
         return
 
-    nombre = USUARIOS_AUTORIZADOS.get(clave)
+    nombre = evento.roster().get(clave)
+    # Nunca se registra la cédula/correo, solo el resultado
+    ANALITICA.registrar("login_ok" if nombre else "login_fallido", user_id, evento=evento.codigo)
     if nombre:
-        PERFILES[user_id] = PerfilUsuario(nombre=nombre, autenticado=True)
+        evento.metricas.logins_ok += 1
+        context.user_data["perfil"] = {"nombre": nombre, "autenticado": True}
         primer_nombre = nombre.split()[0]
-        await update.message.reply_text(
-            f"¡Hola, {primer_nombre}! 😊\n{BIENVENIDA}".replace("}}", "}"),
+        await llamar_tg(
+            update.message.reply_text,
+            f"¡Hola, {primer_nombre}! 😊\n{BIENVENIDA.format(evento=evento.nombre)}".replace("}}", "}"),
             reply_markup=bottom_keyboard()
         )
-        await update.message.reply_text("Menú principal:", reply_markup=principal_inline())
+        await llamar_tg(update.message.reply_text, "Menú principal:", reply_markup=principal_inline())
     else:
-        await update.message.reply_text(
+        evento.metricas.logins_fallidos += 1
+        await llamar_tg(
+            update.message.reply_text,
             "🚫 La cedula o el correo ingresado no aparece resgistrado.\n\n"
             "👉 Si diste clic en un botón sin haberte validado primero, por favor escribe nuevamente tu cédula o correo registrado para continuar.\n\n"
             "Ingresa nuevamente tu cédula o correo registrados:",
@@ -610,13 +1880,14 @@ async def text_ingreso_o_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 # Acciones comunes reutilizables
 async def accion_agenda(upd_or_q, context: ContextTypes.DEFAULT_TYPE):
+    evento = evento_de(context)
     # Si aún estamos en pre-lanzamiento, bloquear
-    en_pre, msg = esta_en_prelanzamiento()
+    en_pre, msg = esta_en_prelanzamiento(evento)
     if en_pre:
         if isinstance(upd_or_q, Update):
-            await upd_or_q.message.reply_text(msg)
+            await llamar_tg(upd_or_q.message.reply_text, msg)
         else:
-            await upd_or_q.message.reply_text(msg)
+            await llamar_tg(upd_or_q.message.reply_text, msg)
         return
 
     if isinstance(upd_or_q, Update):
@@ -627,12 +1898,13 @@ async def accion_agenda(upd_or_q, context: ContextTypes.DEFAULT_TYPE):
         message = q.message
         edit = q.edit_message_text
 
-    if AGENDA_PDF.exists():
+    agenda_pdf = evento.catalogo().agenda_pdf
+    if agenda_pdf and archivo_existe(agenda_pdf):
         if edit:
-            await edit("📅 Agenda del evento (PDF disponible para descargar).")
+            await llamar_tg(edit, "📅 Agenda del evento (PDF disponible para descargar).")
         else:
-            await message.reply_text("📅 Agenda del evento (PDF disponible para descargar).")
-        await envia_documento(upd_or_q, context, AGENDA_PDF, "Agenda del evento")
+            await llamar_tg(message.reply_text, "📅 Agenda del evento (PDF disponible para descargar).")
+        await envia_documento(upd_or_q, context, agenda_pdf, "Agenda del evento")
         return  # evitar duplicado
 
     texto = (
@@ -643,20 +1915,21 @@ async def accion_agenda(upd_or_q, context: ContextTypes.DEFAULT_TYPE):
         "_(Puedes subir un PDF como `data/agenda.pdf` para compartirlo automáticamente.)_"
     )
     if edit:
-        await edit(texto, parse_mode="Markdown")
+        await llamar_tg(edit, texto, parse_mode="Markdown")
     else:
-        await message.reply_text(texto, parse_mode="Markdown")
+        await llamar_tg(message.reply_text, texto, parse_mode="Markdown")
 
-    await message.reply_text("¿Qué deseas hacer ahora?", reply_markup=principal_inline())
+    await llamar_tg(message.reply_text, "¿Qué deseas hacer ahora?", reply_markup=principal_inline())
 
 async def accion_ubicacion(upd_or_q, context: ContextTypes.DEFAULT_TYPE):
+    evento = evento_de(context)
     # Bloqueo en pre-lanzamiento
-    en_pre, msg = esta_en_prelanzamiento()
+    en_pre, msg = esta_en_prelanzamiento(evento)
     if en_pre:
         if isinstance(upd_or_q, Update):
-            await upd_or_q.message.reply_text(msg)
+            await llamar_tg(upd_or_q.message.reply_text, msg)
         else:
-            await upd_or_q.message.reply_text(msg)
+            await llamar_tg(upd_or_q.message.reply_text, msg)
         return
 
     if isinstance(upd_or_q, Update):
@@ -667,20 +1940,24 @@ async def accion_ubicacion(upd_or_q, context: ContextTypes.DEFAULT_TYPE):
         message = q.message
         edit = q.edit_message_text
 
-    texto = "📍 *Ubicación del evento*\nToca el botón para abrir en Google Maps."
+    if evento.ubicacion_url:
+        texto = "📍 *Ubicación del evento*\nToca el botón para abrir en Google Maps."
+    else:
+        texto = "📍 *Ubicación del evento*\nAún no está publicada; te la compartiremos pronto."
     if edit:
-        await edit(texto, parse_mode="Markdown", reply_markup=ubicacion_inline())
+        await llamar_tg(edit, texto, parse_mode="Markdown", reply_markup=ubicacion_inline(evento))
     else:
-        await message.reply_text(texto, parse_mode="Markdown", reply_markup=ubicacion_inline())
+        await llamar_tg(message.reply_text, texto, parse_mode="Markdown", reply_markup=ubicacion_inline(evento))
 
 async def accion_wifi(upd_or_q, context: ContextTypes.DEFAULT_TYPE):
+    evento = evento_de(context)
     # Bloqueo en pre-lanzamiento (por si lo quieres restringir)
-    en_pre, msg = esta_en_prelanzamiento()
+    en_pre, msg = esta_en_prelanzamiento(evento)
     if en_pre:
         if isinstance(upd_or_q, Update):
-            await upd_or_q.message.reply_text(msg)
+            await llamar_tg(upd_or_q.message.reply_text, msg)
         else:
-            await upd_or_q.message.reply_text(msg)
+            await llamar_tg(upd_or_q.message.reply_text, msg)
         return
 
     if isinstance(upd_or_q, Update):
@@ -693,35 +1970,99 @@ async def accion_wifi(upd_or_q, context: ContextTypes.DEFAULT_TYPE):
 
     texto = (
         "📶 *Wi-Fi del evento*\n\n"
-        f"• **Nombre de red:** `{WIFI_SSID}`\n\n"
-        #f"• **Clave:** `{WIFI_PASS}`\n\n"
-        "_*La red es abierta (no necesita clave) \n\n *Se abre una pestaña, le das en visitantes \n\n *Escoges Estelar easy conection \n\n *Y escribes la palabra Estelar2025_"
+        f"• **Nombre de red:** `{evento.wifi_ssid}`\n\n"
+        #f"• **Clave:** `{evento.wifi_pass}`\n\n"
+        f"{evento.wifi_instrucciones}"
     )
     if edit:
-        await edit(texto, parse_mode="Markdown", reply_markup=wifi_inline())
+        await llamar_tg(edit, texto, parse_mode="Markdown", reply_markup=wifi_inline())
     else:
-        await message.reply_text(texto, parse_mode="Markdown", reply_markup=wifi_inline())
+        await llamar_tg(message.reply_text, texto, parse_mode="Markdown", reply_markup=wifi_inline())
+
+class CallbacksEnCurso:
+    """
+    Callbacks que se están procesando, por (bot, usuario, chat, mensaje, botón).
+    Un toque repetido sobre el mismo botón mientras el primero sigue en curso
+    (p.ej. tres toques a un documento) se responde de inmediato con un aviso y
+    no se procesa: no se repiten ediciones ni subidas. Otro botón del mismo
+    mensaje sí se procesa. El bot va en la clave porque el registro es común a
+    todos los eventos y los ids de chat/mensaje de bots distintos pueden coincidir.
+    """
+
+    def __init__(self):
+        self._claves: set = set()
+        self.duplicados = 0
+
+    def __len__(self) -> int:
+        return len(self._claves)
+
+    @staticmethod
+    def clave(query) -> Tuple[str, int, int, int, str]:
+        msg = query.message
+        return (
+            query.get_bot().token,
+            query.from_user.id,
+            msg.chat.id if msg else 0,
+            msg.message_id if msg else 0,
+            query.data or "",
+        )
+
+    def tomar(self, clave) -> bool:
+        if clave in self._claves:
+            self.duplicados += 1
+            return False
+        self._claves.add(clave)
+        return True
+
+    def soltar(self, clave):
+        self._claves.discard(clave)
+
+CALLBACKS_EN_CURSO = CallbacksEnCurso()
+
+async def _responder_callback(query, **kwargs):
+    try:
+        await llamar_tg(query.answer, **kwargs)
+    except Exception:
+        # Un answer fallido (p.ej. callback demasiado viejo) no debe cortar el handler
+        logger.debug("No se pudo responder el callback %s", query.id, exc_info=True)
 
 async def menu_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
+    clave = CallbacksEnCurso.clave(query)
+    if not CALLBACKS_EN_CURSO.tomar(clave):
+        await _responder_callback(query, text="⏳ Procesando…")
+        return
+
+    # El answer corre en paralelo con el handler: el usuario ve el resultado un viaje antes
+    respuesta = asyncio.create_task(_responder_callback(query))
+    try:
+        await procesar_callback(update, context)
+    finally:
+        CALLBACKS_EN_CURSO.soltar(clave)
+        await respuesta
+
+async def procesar_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
 
+    evento = evento_de(context)
     # Bloqueo en pre-lanzamiento
-    en_pre, msg = esta_en_prelanzamiento()
+    en_pre, msg = esta_en_prelanzamiento(evento)
     if en_pre:
-        await query.message.reply_text(msg)
+        await llamar_tg(query.message.reply_text, msg)
         return
 
-    autenticado, _ = await ensure_auth(update, context)
+    autenticado, user_id = await ensure_auth(update, context)
     if not autenticado:
-        await query.edit_message_text("⚠️ Debes validarte primero. Escribe tu **cédula** o **correo**.")
+        await llamar_tg(query.edit_message_text, "⚠️ Debes validarte primero. Escribe tu **cédula** o **correo**.")
         return
 
     data = query.data
+    ANALITICA.registrar("callback", user_id, data, evento=evento.codigo)
+    cat = evento.catalogo()
 
     # Volver al menú principal
     if data == "volver_menu_principal":
-        await query.edit_message_text("Menú principal:", reply_markup=principal_inline())
+        await llamar_tg(query.edit_message_text, "Menú principal:", reply_markup=principal_inline())
         return
 
     # ====== AGENDA ======
@@ -731,17 +2072,19 @@ async def menu_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # ====== MATERIAL POR PRESENTADOR ======
     if data == "menu_material":
-        await query.edit_message_text(
+        await llamar_tg(
+            query.edit_message_text,
             "📚 *Material de apoyo*\nElige un presentador:",
-            reply_markup=presentadores_keyboard("mat_pres"),
+            reply_markup=presentadores_keyboard(evento, "mat_pres"),
             parse_mode="Markdown",
         )
         return
 
     if data.startswith("mat_pres:"):
         pid = data.split(":", 1)[1]
-        nombre = next((n for (i, n) in PRESENTADORES if i == pid), "Presentador")
-        await query.edit_message_text(
+        nombre = cat.nombre_presentador(pid)
+        await llamar_tg(
+            query.edit_message_text,
             f"📚 *Material de {nombre}*",
             reply_markup=material_presentador_menu(pid),
             parse_mode="Markdown",
@@ -750,74 +2093,74 @@ async def menu_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if data.startswith("mat_videos:"):
         pid = data.split(":", 1)[1]
-        videos = MATERIALES.get(pid, {}).get("videos", {})
+        videos = cat.materiales.get(pid, {}).get("videos", {})
         if not videos:
-            await query.edit_message_text("🎬 No hay videos disponibles por ahora.",
-                                          reply_markup=material_presentador_menu(pid))
+            await llamar_tg(query.edit_message_text, "🎬 No hay videos disponibles por ahora.",
+                            reply_markup=material_presentador_menu(pid))
         else:
-            await query.edit_message_text("🎬 *Videos:*",
-                                          reply_markup=lista_archivos_inline(videos, "video", pid),
-                                          parse_mode="Markdown")
+            await llamar_tg(query.edit_message_text, "🎬 *Videos:*",
+                            reply_markup=lista_archivos_inline(videos, "video", pid),
+                            parse_mode="Markdown")
         return
 
     if data.startswith("mat_videos_url:"):  # NUEVO (Drive)
         pid = data.split(":", 1)[1]
-        enlaces = VIDEO_LINKS.get(pid, {})
+        enlaces = cat.video_links.get(pid, {})
         if not enlaces:
-            await query.edit_message_text("🎥 No hay videos por ahora.",
-                                          reply_markup=material_presentador_menu(pid))
+            await llamar_tg(query.edit_message_text, "🎥 No hay videos por ahora.",
+                            reply_markup=material_presentador_menu(pid))
         else:
-            await query.edit_message_text("🎥 *Videos:*",
-                                          reply_markup=lista_video_links_inline(pid),
-                                          parse_mode="Markdown")
+            await llamar_tg(query.edit_message_text, "🎥 *Videos:*",
+                            reply_markup=lista_video_links_inline(evento, pid),
+                            parse_mode="Markdown")
         return
 
     if data.startswith("mat_docs:"):
         pid = data.split(":", 1)[1]
-        docs = MATERIALES.get(pid, {}).get("docs", {})
+        docs = cat.materiales.get(pid, {}).get("docs", {})
         if not docs:
-            await query.edit_message_text("📄 No hay documentos disponibles por ahora.",
-                                          reply_markup=material_presentador_menu(pid))
+            await llamar_tg(query.edit_message_text, "📄 No hay documentos disponibles por ahora.",
+                            reply_markup=material_presentador_menu(pid))
         else:
-            await query.edit_message_text("📄 *Documentos:*",
-                                          reply_markup=lista_archivos_inline(docs, "doc", pid),
-                                          parse_mode="Markdown")
+            await llamar_tg(query.edit_message_text, "📄 *Documentos:*",
+                            reply_markup=lista_archivos_inline(docs, "doc", pid),
+                            parse_mode="Markdown")
         return
 
     # ====== ENLACES ======
     if data == "menu_enlaces":
-        await query.edit_message_text("🔗 *Enlaces y Conexión*",
-                                      reply_markup=enlaces_inline_general(),
-                                      parse_mode="Markdown")
+        await llamar_tg(query.edit_message_text, "🔗 *Enlaces y Conexión*",
+                        reply_markup=enlaces_inline_general(),
+                        parse_mode="Markdown")
         return
 
     if data == "enlaces_por_presentador":
-        await query.edit_message_text("⭐ Elige un presentador:",
-                                      reply_markup=presentadores_keyboard("link_pres"))
+        await llamar_tg(query.edit_message_text, "⭐ Elige un presentador:",
+                        reply_markup=presentadores_keyboard(evento, "link_pres"))
         return
 
     if data.startswith("link_pres:"):
         pid = data.split(":", 1)[1]
-        nombre = next((n for (i, n) in PRESENTADORES if i == pid), "Presentador")
-        enlaces = ENLACES_POR_PRESENTADOR.get(pid, {})
+        nombre = cat.nombre_presentador(pid)
+        enlaces = cat.enlaces.get(pid, {})
         if not enlaces:
-            await query.edit_message_text(f"⭐ *Enlaces de {nombre}*\n(No hay enlaces por ahora.)",
-                                          reply_markup=enlaces_presentador_lista(pid),
-                                          parse_mode="Markdown")
+            await llamar_tg(query.edit_message_text, f"⭐ *Enlaces de {nombre}*\n(No hay enlaces por ahora.)",
+                            reply_markup=enlaces_presentador_lista(evento, pid),
+                            parse_mode="Markdown")
         else:
-            await query.edit_message_text(f"⭐ *Enlaces de {nombre}*:",
-                                          reply_markup=enlaces_presentador_lista(pid),
-                                          parse_mode="Markdown")
+            await llamar_tg(query.edit_message_text, f"⭐ *Enlaces de {nombre}*:",
+                            reply_markup=enlaces_presentador_lista(evento, pid),
+                            parse_mode="Markdown")
         return
 
     if data == "enlaces_conexion":
         texto = f"{ALERTA_CONEXION}\n\nSelecciona una opción:"
-        if not ENLACES_CONEXION:
-            await query.edit_message_text(texto + "\n\nNo hay enlaces de conexión todavía.", parse_mode="Markdown")
+        if not evento.enlaces_conexion:
+            await llamar_tg(query.edit_message_text, texto + "\n\nNo hay enlaces de conexión todavía.", parse_mode="Markdown")
         else:
-            rows = [[InlineKeyboardButton(nombre, url=url)] for nombre, url in ENLACES_CONEXION.items()]
+            rows = [[InlineKeyboardButton(nombre, url=url)] for nombre, url in evento.enlaces_conexion.items()]
             rows.append([InlineKeyboardButton("⬅️ Volver", callback_data="menu_enlaces")])
-            await query.edit_message_text("🧩 Conexiones del evento:", reply_markup=InlineKeyboardMarkup(rows))
+            await llamar_tg(query.edit_message_text, "🧩 Conexiones del evento:", reply_markup=InlineKeyboardMarkup(rows))
         return
 
     # ====== UBICACIÓN ======
@@ -833,7 +2176,7 @@ async def menu_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "2) Luego conéctate a nuestro **Copy JP TACTICAL**.\n\n"
             "Usa los botones de abajo 👇"
         )
-        await query.edit_message_text(texto, parse_mode="Markdown", reply_markup=exness_inline())
+        await llamar_tg(query.edit_message_text, texto, parse_mode="Markdown", reply_markup=exness_inline(evento))
         return
 
     # ====== WIFI ======
@@ -845,53 +2188,326 @@ async def menu_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if data.startswith("video:"):
         # formato: video:<pid>:<titulo>
         _, pid, titulo = data.split(":", 2)
-        ruta = MATERIALES.get(pid, {}).get("videos", {}).get(titulo)
+        ruta = cat.materiales.get(pid, {}).get("videos", {}).get(titulo)
         if ruta:
             await envia_documento(update, context, ruta, titulo)
         else:
-            await query.message.reply_text("No se encontró el video solicitado.")
+            await llamar_tg(query.message.reply_text, "No se encontró el video solicitado.")
         return
 
     if data.startswith("doc:"):
         # formato: doc:<pid>:<titulo>
         _, pid, titulo = data.split(":", 2)
-        ruta = MATERIALES.get(pid, {}).get("docs", {}).get(titulo)
+        ruta = cat.materiales.get(pid, {}).get("docs", {}).get(titulo)
         if ruta:
             await envia_documento(update, context, ruta, titulo)
         else:
-            await query.message.reply_text("No se encontró el documento solicitado.")
+            await llamar_tg(query.message.reply_text, "No se encontró el documento solicitado.")
         return
 
 # =========================
-# MAIN / ARRANQUE
+# ADMIN
 # =========================
 
-def build_app() -> Application:
-    if not BOT_TOKEN:
-        raise RuntimeError("Falta la variable de entorno BOT_TOKEN.")
+async def estadisticas_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not es_admin(update):
+        return
+    if not ANALITICA.activa:
+        await llamar_tg(update.message.reply_text, "📊 La analítica está deshabilitada (ANALYTICS_BACKEND=off).")
+        return
+
+    def bloque(titulo: str, items: List[Tuple[str, int]]) -> str:
+        if not items:
+            return f"{titulo}\n  (sin datos)"
+        return titulo + "\n" + "\n".join(f"  {c} · {clave}" for clave, c in items)
+
+    totales = ", ".join(f"{t}={c}" for t, c in ANALITICA.totales.most_common()) or "(sin eventos)"
+    texto = "\n\n".join([
+        f"📊 Eventos: {totales}",
+        bloque("📄 Documentos más descargados:", ANALITICA.top("callback", "doc:")),
+        bloque("🎥 Listas de videos abiertas:", ANALITICA.top("callback", "mat_videos_url:")),
+        bloque("⌨️ Botones del teclado:", ANALITICA.top("texto")),
+        f"💳 Menú Exness abierto: {ANALITICA.por_clave[('callback', 'menu_exness')]}",
+        bloque("🔗 Clics en enlaces:", REDIRECCIONES.clics.most_common(10))
+        if REDIRECCIONES.habilitado else "🔗 Clics en enlaces: (REDIRECT_ENABLED=false)",
+        "🏷 Por evento:\n" + "\n".join(f"  {e.etiqueta}: {e.metricas.resumen()}" for e in EVENTOS.values()),
+        f"🔁 Telegram: {POLITICA_TG.resumen()}",
+        f"🚀 Arranque: {resumen_arranque()}",
+        f"🗄 Buffer: {ANALITICA.pendientes} pendientes · {ANALITICA.escritos} escritos · "
+        f"{ANALITICA.descartados} descartados · {ANALITICA.fallos} fallos",
+    ])
+    await llamar_tg(update.message.reply_text, texto)
+
+async def estado_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Tablero en vivo: todo sale de contadores ya mantenidos, nada se recorre al pedirlo."""
+    if not es_admin(update):
+        return
+    evento = evento_de(context)
+    updates_min = EN_VIVO.updates.total()
+    errores_min = EN_VIVO.errores.total()
+    tasa_error = errores_min / updates_min if updates_min else 0.0
+    top = EN_VIVO.materiales.most_common(5)
+    texto = "\n".join([
+        f"🟢 Estado en vivo · {evento.etiqueta}",
+        f"👥 Sesiones activas (últimos {SESION_ACTIVA_MIN} min): {len(EN_VIVO.sesiones)}",
+        f"⚡ Updates/s (60 s): {EN_VIVO.updates.por_segundo():.2f}",
+        f"❗ Errores (60 s): {errores_min} · tasa {tasa_error:.1%} · total {EN_VIVO.errores_total}",
+        f"📥 Colas: updates {context.application.update_queue.qsize()} · "
+        f"callbacks en curso {len(CALLBACKS_EN_CURSO)} ({CALLBACKS_EN_CURSO.duplicados} duplicados) · "
+        f"analítica {ANALITICA.pendientes}",
+        f"📦 Caché de archivos: {len(CACHE_ARCHIVOS)} en caché · {CACHE_ARCHIVOS.ratio():.0%} aciertos "
+        f"({CACHE_ARCHIVOS.aciertos}/{CACHE_ARCHIVOS.aciertos + CACHE_ARCHIVOS.fallos}, "
+        f"{CACHE_ARCHIVOS.vencidos} vencidos)",
+        "🔥 Materiales más pedidos: " + (", ".join(f"{n} ({c})" for n, c in top) or "(sin datos)"),
+        f"🔁 Telegram: {POLITICA_TG.resumen()}",
+        f"🐢 Perfilado: handlers lentos {EN_VIVO.handlers_lentos}"
+        + (f" · lag máx. del loop {MONITOR_LOOP.lag_max_ms:.0f} ms · bloqueos {MONITOR_LOOP.bloqueos}"
+           if MONITOR_LOOP.activo else ""),
+        "🏷 Por evento:",
+        *(f"  {e.etiqueta}: {e.metricas.resumen()}" for e in EVENTOS.values()),
+        f"🚀 Arranque: {resumen_arranque()}",
+    ])
+    await llamar_tg(update.message.reply_text, texto)
 
-    app = Application.builder().token(BOT_TOKEN).build()
+async def recargar_roster_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not es_admin(update):
+        return
+    try:
+        n = await asyncio.to_thread(recargar_roster, evento_de(context))
+    except Exception as e:
+        await llamar_tg(update.message.reply_text, f"❌ No se pudo recargar la lista de inscritos: {e}")
+        return
+    await llamar_tg(update.message.reply_text, f"✅ Inscritos recargados: {n} claves.")
 
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_cmd))
-    app.add_handler(CommandHandler("menu", menu_cmd))
+async def recargar_catalogo_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not es_admin(update):
+        return
+    evento = evento_de(context)
+    try:
+        n = await asyncio.to_thread(recargar_catalogo, evento)
+    except Exception as e:
+        await llamar_tg(update.message.reply_text, f"❌ No se pudo recargar el catálogo: {e}")
+        return
+    precargar_redirecciones(evento)
+    await llamar_tg(update.message.reply_text, f"✅ Catálogo recargado: {n} archivos.")
 
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_ingreso_o_menu))
-    app.add_handler(CallbackQueryHandler(menu_callbacks))
+async def limpiar_cache_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not es_admin(update):
+        return
+    n = CACHE_ARCHIVOS.limpiar(evento_de(context).token)
+    await asyncio.to_thread(revisar_archivos)
+    await llamar_tg(update.message.reply_text, f"🧹 Caché limpia: {n} file_id de este evento olvidados; existencia de archivos revisada de nuevo.")
 
+async def perfilar_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/perfilar [segundos]: muestrea el event loop y envía las pilas en formato flamegraph."""
+    if not es_admin(update):
+        return
+    try:
+        segundos = min(max(float(context.args[0]) if context.args else 10.0, 1.0), PERFIL_MAX_SEGUNDOS)
+    except ValueError:
+        await llamar_tg(update.message.reply_text, "Uso: /perfilar [segundos]")
+        return
+    await llamar_tg(update.message.reply_text, f"🔬 Perfilando el event loop durante {segundos:.0f} s…")
+    # Este handler corre en el hilo del loop; el muestreo va en otro hilo
+    pilas = await asyncio.to_thread(
+        muestrear_pila, threading.get_ident(), segundos, PERFIL_INTERVALO_MS / 1000
+    )
+    if not pilas:
+        await llamar_tg(update.message.reply_text, "Sin muestras.")
+        return
+    contenido = "\n".join(f"{pila} {n}" for pila, n in pilas.most_common()) + "\n"
+    await llamar_tg(
+        update.message.reply_document,
+        document=InputFile(io.BytesIO(contenido.encode("utf-8")), filename=f"perfil-{int(time.time())}.folded"),
+        caption=f"{sum(pilas.values())} muestras · {len(pilas)} pilas distintas (flamegraph.pl / speedscope)",
+    )
+
+async def manejar_error(update: object, context: ContextTypes.DEFAULT_TYPE):
+    EN_VIVO.errores.sumar()
+    EN_VIVO.errores_total += 1
+    logger.error("Error procesando un update", exc_info=context.error)
+
+# =========================
+# MAIN / ARRANQUE
+# =========================
+
+# post_init/post_shutdown los llama servir() (no se registran en el builder):
+# post_init una vez por evento tras initialize(), post_shutdown una sola vez al final.
+
+async def post_init(app: Application):
+    evento = EVENTOS[app.bot.token]
+    # Fuera del event loop: lectura de archivos de inscritos/catálogo y stat() de materiales
+    await asyncio.to_thread(calentar_caches, evento)
+    marcar_arranque("caches")
+    await ANALITICA.iniciar()
+    precargar_redirecciones(evento)
+    await REDIRECCIONES.iniciar()
+    await MONITOR_LOOP.iniciar()
+
+async def post_shutdown(app: Application):
+    # Servicios compartidos por todos los eventos: se detienen una sola vez al final
+    await MONITOR_LOOP.detener()
+    await REDIRECCIONES.detener()
+    await ANALITICA.detener()
+    await asyncio.to_thread(cerrar_conexiones)
+
+class WebhookHandler(tornado.web.RequestHandler):
+    """Recibe los updates de Telegram y los encola en la Application del evento."""
+
+    def initialize(self, bot_app: Application):
+        # "application" ya es un atributo de tornado.web.RequestHandler
+        self.bot_app = bot_app
+
+    async def post(self):
+        if WEBHOOK_SECRET and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            raise tornado.web.HTTPError(403)
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+        await self.bot_app.update_queue.put(Update.de_json(data, self.bot_app.bot))
+        self.set_status(200)
+
+class SaludHandler(tornado.web.RequestHandler):
+    """/healthz: el proceso responde. /ready: cachés calientes y Applications iniciadas."""
+
+    def initialize(self, readiness: bool):
+        self.readiness = readiness
+
+    def get(self):
+        if self.readiness and "listo" not in ARRANQUE:
+            self.set_status(503)
+            self.finish({"listo": False})
+            return
+        self.finish({"listo": "listo" in ARRANQUE, "arranque_ms": ARRANQUE})
+
+class RedireccionHandler(tornado.web.RequestHandler):
+    def get(self, codigo: str):
+        destino = REDIRECCIONES.resolver(codigo)
+        if destino is None:
+            raise tornado.web.HTTPError(404)
+        self.redirect(destino, status=302)
+
+def servidor_web(apps: List[Application]) -> tornado.web.Application:
+    rutas = [
+        (EVENTOS[app.bot.token].webhook_path, WebhookHandler, {"bot_app": app}) for app in apps
+    ]
+    rutas += [
+        (r"/healthz", SaludHandler, {"readiness": False}),
+        (r"/ready", SaludHandler, {"readiness": True}),
+    ]
+    if REDIRECCIONES.habilitado:
+        rutas.append((r"/r/([A-Za-z0-9_-]+)", RedireccionHandler))
+    return tornado.web.Application(rutas)
+
+async def servir(apps: List[Application], webhook: bool):
+    """
+    Corre todas las Applications (una por evento) en el mismo event loop.
+    En modo webhook usa un servidor propio en lugar de application.run_webhook()
+    para exponer varias rutas de webhook y rutas adicionales (redirecciones,
+    /ready) en el mismo puerto. El puerto se abre antes de inicializar los Bots:
+    los updates que lleguen mientras tanto quedan en la cola de su evento y se
+    procesan al llamar application.start().
+    """
+    server = None
+    if webhook:
+        server = HTTPServer(servidor_web(apps), xheaders=True)
+        server.listen(PORT, "0.0.0.0")
+        marcar_arranque("escuchando")
+
+    detener = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, detener.set)
+
+    async def iniciar(app: Application):
+        await app.initialize()
+        await post_init(app)
+        if webhook:
+            await app.bot.set_webhook(
+                url=f"{WEBHOOK_HOST}{EVENTOS[app.bot.token].webhook_path}",
+                secret_token=WEBHOOK_SECRET or None,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=ALLOWED_UPDATES,
+            )
+        else:
+            await app.updater.start_polling(drop_pending_updates=True, allowed_updates=ALLOWED_UPDATES)
+        await app.start()
+
+    try:
+        await asyncio.gather(*(iniciar(app) for app in apps))
+        marcar_arranque("listo")
+        await detener.wait()
+    finally:
+        if server is not None:
+            server.stop()
+        # Primero se detienen todas (stop() espera a los handlers en curso) y solo
+        # después se apagan: shutdown() cierra el HTTPXRequest compartido, y un
+        # handler de otro evento que siga respondiendo fallaría con el cliente cerrado.
+        for app in apps:
+            if app.updater and app.updater.running:
+                await app.updater.stop()
+            if app.running:
+                await app.stop()
+        for app in apps:
+            await app.shutdown()
+        await post_shutdown(apps[0])
+
+@lru_cache(maxsize=None)
+def request_compartido() -> HTTPXRequest:
+    """Un solo pool de conexiones HTTP hacia Telegram para todos los eventos."""
+    return HTTPXRequest(connection_pool_size=HTTP_POOL_SIZE)
+
+def build_app(evento: Optional[Evento] = None) -> Application:
+    if evento is None:
+        if not EVENTOS:
+            raise RuntimeError("Falta la variable de entorno BOT_TOKEN (o EVENTOS_FILE).")
+        evento = next(iter(EVENTOS.values()))
+
+    marcar_arranque("import")
+    builder = (
+        Application.builder()
+        .token(evento.token)
+        .base_url(TELEGRAM_API_URL)
+        .request(request_compartido())
+        .concurrent_updates(CONCURRENT_UPDATES)
+    )
+    if PERSISTENCIA_URL:
+        builder = builder.persistence(
+            PersistenciaSQL(PERSISTENCIA_URL, update_interval=PERSISTENCIA_INTERVALO, espacio=evento.codigo)
+        )
+    app = builder.build()
+
+    app.add_handler(TypeHandler(Update, contar_update), group=-1)
+    app.add_handler(CommandHandler("start", cronometrado(start)))
+    app.add_handler(CommandHandler("help", cronometrado(help_cmd)))
+    app.add_handler(CommandHandler("menu", cronometrado(menu_cmd)))
+    app.add_handler(CommandHandler("estadisticas", cronometrado(estadisticas_cmd)))
+    app.add_handler(CommandHandler("estado", cronometrado(estado_cmd)))
+    app.add_handler(CommandHandler("recargar_roster", cronometrado(recargar_roster_cmd)))
+    app.add_handler(CommandHandler("recargar_catalogo", cronometrado(recargar_catalogo_cmd)))
+    app.add_handler(CommandHandler("limpiar_cache", cronometrado(limpiar_cache_cmd)))
+    app.add_handler(CommandHandler("perfilar", perfilar_cmd))
+
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, cronometrado(text_ingreso_o_menu)))
+    app.add_handler(CallbackQueryHandler(cronometrado(menu_callbacks)))
+    app.add_error_handler(manejar_error)
+
+    marcar_arranque("build_app")
     return app
 
 
 if __name__ == "__main__":
-    application = build_app()
-
-    if USE_WEBHOOK and WEBHOOK_URL:
-        application.run_webhook(
-            listen="0.0.0.0",
-            port=PORT,
-            url_path=WEBHOOK_PATH,
-            webhook_url=WEBHOOK_URL,
-        )
-    else:
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    # httpx loguea cada petición a Telegram en INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    aplicaciones = [build_app(evento) for evento in EVENTOS.values()] or [build_app()]
+
+    webhook = MODO_WEBHOOK
+    if not webhook:
         print("Iniciando en modo polling. Establece USE_WEBHOOK=true y WEBHOOK_HOST para producción.")
-        application.run_polling(drop_pending_updates=True)
+    asyncio.run(servir(aplicaciones, webhook))
@@ -0,0 +1,72 @@
+"""
+Latencia de arranque hasta la primera respuesta, sin red:
+
+    python tests/bench_arranque.py
+
+Levanta la Bot API falsa, importa app.py, arma la Application de cada evento,
+calienta cachés y teclados, y procesa un /start sintético de punta a punta
+(initialize → handlers → sendMessage). Imprime las marcas de ARRANQUE en JSON.
+test_arranque.py lo corre en un proceso aparte y compara contra un presupuesto.
+"""
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+UPDATE_START = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Bench"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+
+async def primer_update(app, aplicacion):
+    from telegram import Update
+
+    async with aplicacion:
+        await aplicacion.process_update(Update.de_json(UPDATE_START, aplicacion.bot))
+    app.marcar_arranque("primera_respuesta")
+
+
+def main():
+    api = FakeBotAPI().iniciar()
+    os.environ["TELEGRAM_API_URL"] = api.base_url
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+    os.environ.setdefault("ANALYTICS_BACKEND", "off")
+    os.environ.setdefault("PERSISTENCIA_URL", "")
+    os.environ.setdefault("LAUNCH_DATE", "")
+    try:
+        import app
+
+        aplicaciones = []
+        for evento in app.EVENTOS.values():
+            aplicaciones.append(app.build_app(evento))
+            app.calentar_caches(evento)
+            app.marcar_arranque("caches")
+            app.precargar_redirecciones(evento)
+            app.principal_inline()
+            for pid, _ in evento.catalogo().presentadores:
+                app.presentadores_keyboard(evento, "mat_pres")
+                app.material_presentador_menu(pid)
+                app.lista_video_links_inline(evento, pid)
+                app.enlaces_presentador_lista(evento, pid)
+        app.marcar_arranque("teclados")
+        asyncio.run(primer_update(app, aplicaciones[0]))
+    finally:
+        api.detener()
+    print(json.dumps({"arranque": app.ARRANQUE, "llamadas": api.metodos()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Fixtures para correr el bot completo (build_app + handlers) contra una Bot API
+falsa local, sin red ni token real.
+
+Cada escenario registra cuántas llamadas hizo a la API y cuántos bytes subió;
+al final de la corrida se imprime la tabla (ver pytest_terminal_summary).
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+API = FakeBotAPI().iniciar()
+
+# app.py lee la configuración al importarse: se fija antes del import
+os.environ.update(
+    BOT_TOKEN="123456:PRUEBA",
+    TELEGRAM_API_URL=API.base_url,
+    # Caso de polling con redirecciones pedidas: no debe generar enlaces /r/ sin servidor
+    USE_WEBHOOK="true",
+    WEBHOOK_HOST="",
+    REDIRECT_ENABLED="true",
+    REDIRECT_BASE_URL="https://bot.example",
+    ANALYTICS_BACKEND="off",
+    PERSISTENCIA_URL="",
+    EVENTOS_FILE="",
+    ROSTER_FILE="",
+    CATALOGO_FILE="",
+    LAUNCH_DATE="",
+    ADMIN_IDS="99",
+    TG_BACKOFF_BASE="0.01",
+    TG_BACKOFF_MAX="0.05",
+    SLOW_HANDLER_MS="0",
+    LOOP_LAG_MS="0",
+)
+
+import app  # noqa: E402
+from telegram import Update  # noqa: E402
+
+USUARIO = 77
+ADMIN = 99
+CEDULA = "75106729"
+
+RESULTADOS = {}
+
+
+class BotDePrueba:
+    """
+    Application real de app.build_app() en un event loop propio. Las pruebas
+    son síncronas: cada update se procesa completo antes de volver.
+    """
+
+    def __init__(self, api: FakeBotAPI, evento=None):
+        self.api = api
+        self.loop = asyncio.new_event_loop()
+        self.app = app.build_app(evento)
+        self.evento = app.EVENTOS[self.app.bot.token]
+        self._update_id = 0
+        self.correr(self.app.initialize())
+        # getMe de initialize() no cuenta para el escenario
+        api.llamadas.clear()
+
+    def correr(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def cerrar(self):
+        self.correr(self.app.shutdown())
+        self.loop.close()
+
+    def _siguiente_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+
+    def _usuario(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Ana"}
+
+    def _mensaje(self, texto: str, user_id: int) -> dict:
+        uid = self._siguiente_id()
+        mensaje = {
+            "message_id": uid,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._usuario(user_id),
+            "text": texto,
+        }
+        if texto.startswith("/"):
+            mensaje["entities"] = [{"type": "bot_command", "offset": 0, "length": len(texto.split()[0])}]
+        return {"update_id": uid, "message": mensaje}
+
+    def _callback(self, data: str, user_id: int) -> dict:
+        uid = self._siguiente_id()
+        return {
+            "update_id": uid,
+            "callback_query": {
+                "id": str(uid),
+                "from": self._usuario(user_id),
+                "chat_instance": "prueba",
+                "data": data,
+                "message": {"message_id": 5, "date": 0, "chat": {"id": user_id, "type": "private"}, "text": "menú"},
+            },
+        }
+
+    async def _procesar(self, datos: dict):
+        await self.app.process_update(Update.de_json(datos, self.app.bot))
+
+    def enviar(self, texto: str, user_id: int = USUARIO):
+        self.correr(self._procesar(self._mensaje(texto, user_id)))
+
+    def tocar(self, data: str, user_id: int = USUARIO):
+        self.correr(self._procesar(self._callback(data, user_id)))
+
+    def tocar_a_la_vez(self, data: str, veces: int, user_id: int = USUARIO):
+        """Varios toques del mismo botón que llegan juntos (el mismo callback reenviado)."""
+        datos = self._callback(data, user_id)
+
+        async def todos():
+            await asyncio.gather(*(self._procesar(datos) for _ in range(veces)))
+        self.correr(todos())
+
+    def tocar_juntos(self, *datas: str, user_id: int = USUARIO):
+        """Toques a botones distintos del mismo mensaje que llegan juntos."""
+        updates = [self._callback(data, user_id) for data in datas]
+
+        async def todos():
+            await asyncio.gather(*(self._procesar(datos) for datos in updates))
+        self.correr(todos())
+
+    def ingresar(self, user_id: int = USUARIO, cedula: str = CEDULA):
+        self.enviar(cedula, user_id)
+        self.api.llamadas.clear()
+
+
+@pytest.fixture
+def api():
+    API.reiniciar()
+    yield API
+    API.reiniciar()
+
+
+@pytest.fixture
+def bot(api, request):
+    # Estado global del proceso que no debe filtrarse entre escenarios
+    app.CACHE_ARCHIVOS = app.CacheArchivos()
+    app.archivo_existe.cache_clear()
+    app.POLITICA_TG = app.PoliticaReintentos(
+        app.TG_INTENTOS, app.TG_BACKOFF_BASE, app.TG_BACKOFF_MAX,
+        app.TG_PRESUPUESTO_REINTENTOS, app.TG_PRESUPUESTO_VENTANA,
+        app.TG_CIRCUITO_FALLOS, app.TG_CIRCUITO_ESPERA,
+    )
+    b = BotDePrueba(api)
+    yield b
+    RESULTADOS[request.node.nodeid] = (api.contar(), api.bytes_subidos())
+    b.cerrar()
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTADOS:
+        return
+    terminalreporter.section("llamadas a la Bot API por escenario")
+    ancho = max(len(n) for n in RESULTADOS)
+    for nodeid, (llamadas, subidos) in RESULTADOS.items():
+        terminalreporter.write_line(f"{nodeid:<{ancho}}  {llamadas:>4} llamadas  {subidos:>9} bytes")
+
+
+def pytest_sessionfinish(session):
+    API.detener()
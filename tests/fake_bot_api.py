@@ -0,0 +1,172 @@
+"""
+Servidor HTTP local que imita la Bot API de Telegram para pruebas offline.
+"""
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+
+class LlamadaAPI:
+    def __init__(self, metodo: str, params: dict, bytes_subidos: int):
+        self.metodo = metodo
+        self.params = params
+        self.bytes_subidos = bytes_subidos
+
+    def __repr__(self):
+        return f"LlamadaAPI({self.metodo!r}, {self.params!r})"
+
+
+class FakeBotAPI:
+    """
+    Responde a los métodos que usa el bot y guarda cada llamada.
+    `fallos` permite simular errores: {"sendMessage": [502, 502]} hace que las
+    dos primeras llamadas a sendMessage respondan 502.
+    """
+
+    BOT_ID = 4242
+
+    def __init__(self):
+        self.llamadas: List[LlamadaAPI] = []
+        self.fallos: Dict[str, List[int]] = {}
+        self.respuestas: Dict[str, dict] = {}
+        self.demora: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._message_id = 1000
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._hilo: Optional[threading.Thread] = None
+
+    # --- ciclo de vida ---
+
+    def iniciar(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                api._atender(self)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._hilo = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/bot"
+
+    # --- consultas para las pruebas ---
+
+    def reiniciar(self):
+        with self._lock:
+            self.llamadas.clear()
+            self.fallos.clear()
+            self.respuestas.clear()
+            self.demora.clear()
+
+    def metodos(self) -> List[str]:
+        return [c.metodo for c in self.llamadas]
+
+    def contar(self, metodo: Optional[str] = None) -> int:
+        return sum(1 for c in self.llamadas if metodo is None or c.metodo == metodo)
+
+    def bytes_subidos(self) -> int:
+        return sum(c.bytes_subidos for c in self.llamadas)
+
+    def ultima(self, metodo: str) -> LlamadaAPI:
+        return [c for c in self.llamadas if c.metodo == metodo][-1]
+
+    # --- implementación ---
+
+    def _leer_params(self, req: BaseHTTPRequestHandler):
+        largo = int(req.headers.get("Content-Length") or 0)
+        cuerpo = req.rfile.read(largo) if largo else b""
+        tipo = req.headers.get("Content-Type", "")
+        if tipo.startswith("application/json"):
+            return json.loads(cuerpo or b"{}"), 0
+        if tipo.startswith("multipart/form-data"):
+            msg = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {tipo}\r\n\r\n".encode() + cuerpo
+            )
+            params, subidos = {}, 0
+            for parte in msg.iter_parts():
+                nombre = parte.get_param("name", header="content-disposition")
+                datos = parte.get_payload(decode=True) or b""
+                if parte.get_filename():
+                    subidos += len(datos)
+                    params[nombre] = {"filename": parte.get_filename(), "size": len(datos)}
+                else:
+                    params[nombre] = datos.decode("utf-8")
+            return params, subidos
+        return {k: v[0] for k, v in parse_qs(cuerpo.decode()).items()}, 0
+
+    def _atender(self, req: BaseHTTPRequestHandler):
+        metodo = req.path.rsplit("/", 1)[-1]
+        params, subidos = self._leer_params(req)
+        with self._lock:
+            self.llamadas.append(LlamadaAPI(metodo, params, subidos))
+            pendientes = self.fallos.get(metodo)
+            status = pendientes.pop(0) if pendientes else 200
+            demora = self.demora.get(metodo, 0)
+        if demora:
+            time.sleep(demora)
+        if status != 200:
+            cuerpo = {"ok": False, "error_code": status, "description": f"Simulated error {status}"}
+            if metodo in self.respuestas and "description" in self.respuestas[metodo]:
+                cuerpo["description"] = self.respuestas[metodo]["description"]
+        else:
+            cuerpo = {"ok": True, "result": self._resultado(metodo, params)}
+        datos = json.dumps(cuerpo).encode()
+        req.send_response(status)
+        req.send_header("Content-Type", "application/json")
+        req.send_header("Content-Length", str(len(datos)))
+        req.end_headers()
+        req.wfile.write(datos)
+
+    def _mensaje(self, params: dict, **extra) -> dict:
+        with self._lock:
+            self._message_id += 1
+            mid = self._message_id
+        chat_id = int(params.get("chat_id") or 1)
+        return {
+            "message_id": int(params.get("message_id") or mid),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": self.BOT_ID, "is_bot": True, "first_name": "Bot"},
+            **extra,
+        }
+
+    def _resultado(self, metodo: str, params: dict):
+        if metodo == "getMe":
+            return {"id": self.BOT_ID, "is_bot": True, "first_name": "Bot", "username": "bootcamp_bot"}
+        if metodo in {"sendMessage", "editMessageText"}:
+            return self._mensaje(params, text=params.get("text", ""))
+        if metodo == "sendDocument":
+            doc = params.get("document")
+            file_id = doc if isinstance(doc, str) else f"FILE_{doc['filename']}"
+            return self._mensaje(params, document={"file_id": file_id, "file_unique_id": file_id})
+        if metodo == "sendVideo":
+            vid = params.get("video")
+            file_id = vid if isinstance(vid, str) else f"FILE_{vid['filename']}"
+            return self._mensaje(params, video={
+                "file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1, "duration": 1,
+            })
+        if metodo == "getUpdates":
+            return []
+        if metodo == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        return True
@@ -0,0 +1,26 @@
+"""
+Presupuesto de arranque: import → primera respuesta a un /start, medido en un
+proceso nuevo (el import de app ya está en caché dentro de pytest).
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Holgado para máquinas de CI lentas; se puede ajustar por entorno
+PRESUPUESTO_MS = float(os.getenv("ARRANQUE_PRESUPUESTO_MS", "5000"))
+
+
+def test_primera_respuesta_dentro_del_presupuesto():
+    bench = Path(__file__).with_name("bench_arranque.py")
+    entorno = {k: v for k, v in os.environ.items() if k not in {"EVENTOS_FILE", "TELEGRAM_API_URL"}}
+    salida = subprocess.run(
+        [sys.executable, str(bench)], capture_output=True, text=True, timeout=60, env=entorno, check=True,
+    ).stdout
+    resultado = json.loads(salida)
+    arranque = resultado["arranque"]
+
+    assert resultado["llamadas"] == ["getMe", "sendMessage"]
+    assert list(arranque) == ["import", "build_app", "caches", "teclados", "primer_update", "primera_respuesta"]
+    assert arranque["primera_respuesta"] < PRESUPUESTO_MS, arranque
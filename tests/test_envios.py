@@ -0,0 +1,116 @@
+"""
+Rutas de subida de envia_documento: primera subida, reenvío por file_id,
+videos, reintentos y toques repetidos. Se cuentan los bytes que llegan a la API.
+"""
+from collections import Counter
+
+import app
+
+TITULO = "VALORACIÓN RAPIDA JP TACTICAL"
+DOC = f"doc:p2:{TITULO}"
+TAMANO = app.MATERIALES["p2"]["docs"][TITULO].stat().st_size
+
+
+def test_primera_subida(bot, api):
+    bot.ingresar()
+    bot.tocar(DOC)
+    assert Counter(api.metodos()) == Counter(
+        answerCallbackQuery=1, sendChatAction=1, sendMessage=2, sendDocument=1, editMessageText=1,
+    )
+    assert api.bytes_subidos() == TAMANO
+
+
+def test_reenvio_por_file_id(bot, api):
+    bot.ingresar()
+    bot.tocar(DOC)
+    api.llamadas.clear()
+
+    bot.tocar(DOC)
+    assert Counter(api.metodos()) == Counter(answerCallbackQuery=1, sendDocument=1, sendMessage=1)
+    assert api.bytes_subidos() == 0
+    assert api.ultima("sendDocument").params["document"] == f"FILE_{app.MATERIALES['p2']['docs'][TITULO].name}"
+
+
+def test_file_id_vencido_vuelve_a_subir(bot, api):
+    bot.ingresar()
+    bot.tocar(DOC)
+    api.llamadas.clear()
+
+    api.fallos["sendDocument"] = [400]
+    api.respuestas["sendDocument"] = {"description": "Bad Request: wrong file identifier/http url specified"}
+    bot.tocar(DOC)
+    assert api.contar("sendDocument") == 2
+    assert api.bytes_subidos() == TAMANO
+    # El file_id rechazado no cuenta como acierto de la caché
+    assert (app.CACHE_ARCHIVOS.aciertos, app.CACHE_ARCHIVOS.vencidos) == (0, 1)
+
+
+def test_subida_de_video(bot, api, tmp_path, monkeypatch):
+    ruta = tmp_path / "intro.mp4"
+    ruta.write_bytes(b"\0" * 4096)
+    monkeypatch.setitem(bot.evento.catalogo().materiales["p1"]["videos"], "Intro", ruta)
+    bot.ingresar()
+
+    bot.tocar("video:p1:Intro")
+    assert api.contar("sendVideo") == 1
+    assert api.contar("sendDocument") == 0
+    assert api.bytes_subidos() == 4096
+
+
+def test_archivo_inexistente(bot, api, tmp_path, monkeypatch):
+    monkeypatch.setitem(bot.evento.catalogo().materiales["p1"]["docs"], "Falta", tmp_path / "falta.pdf")
+    bot.ingresar()
+
+    bot.tocar("doc:p1:Falta")
+    assert Counter(api.metodos()) == Counter(answerCallbackQuery=1, sendMessage=1)
+    assert "No encuentro" in api.ultima("sendMessage").params["text"]
+
+
+def test_reintento_tras_502(bot, api):
+    bot.ingresar()
+    api.fallos["sendDocument"] = [502]
+
+    bot.tocar(DOC)
+    # El reintento vuelve a abrir el archivo: se sube completo otra vez
+    assert api.contar("sendDocument") == 2
+    assert api.bytes_subidos() == 2 * TAMANO
+
+
+def test_toques_repetidos_suben_una_vez(bot, api):
+    bot.ingresar()
+    api.demora["sendDocument"] = 0.2
+
+    bot.tocar_a_la_vez(DOC, 4)
+    assert api.contar("sendDocument") == 1
+    assert api.contar("answerCallbackQuery") == 4
+    assert api.bytes_subidos() == TAMANO
+
+
+def test_botones_distintos_del_mismo_mensaje(bot, api):
+    bot.ingresar()
+    api.demora["sendDocument"] = 0.2
+
+    bot.tocar_juntos(DOC, "doc:p2:VALORACIÓN RAPIDA JP TACTICAL DIDACTICA")
+    assert api.contar("sendDocument") == 2
+    assert api.bytes_subidos() == TAMANO + app.MATERIALES["p2"]["docs"][
+        "VALORACIÓN RAPIDA JP TACTICAL DIDACTICA"
+    ].stat().st_size
+
+
+def test_agenda_en_pdf(bot, api, tmp_path, monkeypatch):
+    ruta = tmp_path / "agenda.pdf"
+    ruta.write_bytes(b"%PDF-1.4\n" + b"\0" * 2048)
+    monkeypatch.setattr(bot.evento.catalogo(), "agenda_pdf", ruta)
+    bot.ingresar()
+
+    bot.tocar("menu_agenda")
+    assert Counter(api.metodos()) == Counter(
+        answerCallbackQuery=1, editMessageText=2, sendChatAction=1, sendMessage=2, sendDocument=1,
+    )
+    assert api.bytes_subidos() == ruta.stat().st_size
+    assert api.ultima("sendDocument").params["document"]["filename"] == "agenda.pdf"
+
+    api.llamadas.clear()
+    bot.enviar(app.BTN_AGENDA)
+    assert Counter(api.metodos()) == Counter(sendMessage=2, sendDocument=1)
+    assert api.bytes_subidos() == 0
@@ -0,0 +1,147 @@
+"""
+EVENTOS_FILE: validación de cargar_eventos() y aislamiento entre eventos que
+corren en el mismo proceso (inscritos, catálogo, Wi-Fi, enlaces, ubicación).
+"""
+import json
+
+import pytest
+
+import app
+from conftest import ADMIN, BotDePrueba
+
+TOKEN_A = "111:MEDELLIN"
+TOKEN_B = "222:BOGOTA"
+
+
+@pytest.fixture
+def archivos(tmp_path, monkeypatch):
+    """Dos eventos completos; cada prueba puede modificar las definiciones antes de cargarlas."""
+    (tmp_path / "medellin.csv").write_text("1001,Ana Medellín\n", encoding="utf-8")
+    (tmp_path / "bogota.csv").write_text("2002,Beto Bogotá\n", encoding="utf-8")
+    (tmp_path / "medellin.json").write_text(json.dumps({
+        "presentadores": [["m1", "Presentador Medellín"]],
+        "enlaces": {"m1": {"Canal": "https://example.com/medellin"}},
+        "agenda_pdf": "medellin/agenda.pdf",
+    }), encoding="utf-8")
+    (tmp_path / "guia.pdf").write_bytes(b"%PDF-1.4\n")
+    (tmp_path / "bogota.json").write_text(json.dumps({
+        "presentadores": [["b1", "Presentador Bogotá"]],
+        "materiales": {"b1": {"docs": {"Guía": str(tmp_path / "guia.pdf")}}},
+    }), encoding="utf-8")
+    definiciones = [
+        {"codigo": "medellin", "token": TOKEN_A,
+         "roster_file": str(tmp_path / "medellin.csv"), "catalogo_file": str(tmp_path / "medellin.json"),
+         "wifi_ssid": "RED-MEDELLIN", "ubicacion_url": "https://maps.example/medellin",
+         "enlaces_conexion": {"Día 1": "https://example.com/dia1"}},
+        {"codigo": "bogota", "token_env": "BOT_TOKEN_BOGOTA",
+         "roster_file": str(tmp_path / "bogota.csv"), "catalogo_file": str(tmp_path / "bogota.json")},
+    ]
+    monkeypatch.setenv("BOT_TOKEN_BOGOTA", TOKEN_B)
+    ruta = tmp_path / "eventos.json"
+    monkeypatch.setattr(app, "EVENTOS_FILE", str(ruta))
+
+    def cargar():
+        ruta.write_text(json.dumps(definiciones), encoding="utf-8")
+        return app.cargar_eventos()
+    cargar.definiciones = definiciones
+    return cargar
+
+
+def test_carga_dos_eventos(archivos):
+    eventos = archivos()
+    assert set(eventos) == {TOKEN_A, TOKEN_B}
+    assert eventos[TOKEN_B].codigo == "bogota"
+    assert eventos[TOKEN_B].nombre == "bogota"
+
+
+def test_campo_desconocido(archivos):
+    archivos.definiciones[0]["wifi_clave"] = "x"
+    with pytest.raises(RuntimeError, match="wifi_clave"):
+        archivos()
+
+
+def test_token_repetido(archivos):
+    archivos.definiciones[1]["token_env"] = ""
+    archivos.definiciones[1]["token"] = TOKEN_A
+    with pytest.raises(RuntimeError, match="Token repetido"):
+        archivos()
+
+
+def test_token_env_sin_definir(archivos, monkeypatch):
+    monkeypatch.delenv("BOT_TOKEN_BOGOTA")
+    with pytest.raises(RuntimeError, match="sin token"):
+        archivos()
+
+
+@pytest.mark.parametrize("campo", ["roster_file", "catalogo_file", "codigo"])
+def test_campo_obligatorio(archivos, campo):
+    del archivos.definiciones[1][campo]
+    with pytest.raises(RuntimeError, match=campo):
+        archivos()
+
+
+def test_sin_herencia_del_evento_por_defecto(archivos):
+    bogota = archivos()[TOKEN_B]
+    assert (bogota.wifi_ssid, bogota.ubicacion_url, bogota.enlaces_conexion) == ("", "", {})
+    assert bogota.roster() == {"2002": "Beto Bogotá"}
+    catalogo = bogota.catalogo()
+    assert catalogo.presentadores == [("b1", "Presentador Bogotá")]
+    assert list(catalogo.materiales["b1"]["docs"]) == ["Guía"]
+    assert catalogo.agenda_pdf is None and catalogo.enlaces == {}
+    # Sin ubicación no hay botón de Maps (Telegram rechaza url vacía)
+    assert [b.callback_data for fila in app.ubicacion_inline(bogota).inline_keyboard for b in fila] == [
+        "volver_menu_principal"
+    ]
+
+
+def test_eventos_aislados_en_el_mismo_proceso(archivos, api, monkeypatch):
+    eventos = archivos()
+    monkeypatch.setattr(app, "EVENTOS", eventos)
+    medellin = BotDePrueba(api, eventos[TOKEN_A])
+    bogota = BotDePrueba(api, eventos[TOKEN_B])
+    try:
+        # La cédula de un evento no da acceso al otro
+        bogota.enviar("1001")
+        assert "perfil" not in bogota.app.user_data[77]
+        bogota.ingresar(cedula="2002")
+        medellin.ingresar(cedula="1001")
+        assert bogota.app.user_data[77]["perfil"]["nombre"] == "Beto Bogotá"
+        assert medellin.app.user_data[77]["perfil"]["nombre"] == "Ana Medellín"
+
+        medellin.tocar("menu_wifi")
+        assert "RED-MEDELLIN" in api.ultima("editMessageText").params["text"]
+        bogota.tocar("menu_wifi")
+        assert "RED-MEDELLIN" not in api.ultima("editMessageText").params["text"]
+
+        bogota.tocar("menu_ubicacion")
+        assert "Aún no está publicada" in api.ultima("editMessageText").params["text"]
+        assert "url" not in api.ultima("editMessageText").params["reply_markup"]
+
+        assert (medellin.evento.metricas.logins_ok, bogota.evento.metricas.logins_ok) == (1, 1)
+        assert bogota.evento.metricas.logins_fallidos == 1
+    finally:
+        medellin.cerrar()
+        bogota.cerrar()
+
+
+def test_limpiar_cache_no_enfria_otros_eventos(archivos, api, monkeypatch):
+    eventos = archivos()
+    monkeypatch.setattr(app, "EVENTOS", eventos)
+    monkeypatch.setattr(app, "CACHE_ARCHIVOS", app.CacheArchivos())
+    guia = eventos[TOKEN_B].catalogo().materiales["b1"]["docs"]["Guía"]
+    app.CACHE_ARCHIVOS.guardar(TOKEN_A, guia, "FILE_MEDELLIN")
+    app.CACHE_ARCHIVOS.guardar(TOKEN_B, guia, "FILE_BOGOTA")
+
+    medellin = BotDePrueba(api, eventos[TOKEN_A])
+    try:
+        medellin.enviar("/limpiar_cache", user_id=ADMIN)
+    finally:
+        medellin.cerrar()
+    assert "1 file_id" in api.ultima("sendMessage").params["text"]
+    assert app.CACHE_ARCHIVOS.obtener(TOKEN_A, guia) is None
+    assert app.CACHE_ARCHIVOS.obtener(TOKEN_B, guia) == "FILE_BOGOTA"
+
+    # La existencia de los materiales de Bogotá quedó revisada: no hay stat() en el loop
+    antes = app.archivo_existe.cache_info().misses
+    assert app.archivo_existe(guia)
+    assert app.archivo_existe.cache_info().misses == antes
@@ -0,0 +1,105 @@
+"""
+PersistenciaSQL sobre SQLite: ida y vuelta, espacios por evento, borrados,
+flush y filas ilegibles; y la conexión compartida tras un error.
+"""
+import asyncio
+import pickle
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def url(tmp_path):
+    yield f"sqlite:///{tmp_path / 'bot.db'}"
+    app.cerrar_conexiones()
+
+
+def guardar(url, espacio, usuarios, borrar=()):
+    async def correr():
+        p = app.PersistenciaSQL(url, espacio=espacio)
+        await p.get_user_data()
+        for uid, datos in usuarios.items():
+            await p.update_user_data(uid, datos)
+        for uid in borrar:
+            await p.drop_user_data(uid)
+        await p.flush()
+        return p
+    return asyncio.run(correr())
+
+
+def leer(url, espacio):
+    return asyncio.run(app.PersistenciaSQL(url, espacio=espacio).get_user_data())
+
+
+def test_ida_y_vuelta(url):
+    perfil = {"perfil": {"nombre": "Ana", "autenticado": True}}
+    p = guardar(url, "", {77: perfil, 78: {"x": 1}})
+    assert p.lotes_escritos == 1
+    assert leer(url, "") == {77: perfil, 78: {"x": 1}}
+
+
+def test_espacios_por_evento(url):
+    guardar(url, "", {1: {"evento": "principal"}})
+    guardar(url, "medellin", {1: {"evento": "medellin"}})
+    guardar(url, "bogota", {2: {"evento": "bogota"}})
+
+    assert leer(url, "") == {1: {"evento": "principal"}}
+    assert leer(url, "medellin") == {1: {"evento": "medellin"}}
+    assert leer(url, "bogota") == {2: {"evento": "bogota"}}
+
+
+def test_drop_borra_la_fila(url):
+    guardar(url, "medellin", {1: {"a": 1}, 2: {"b": 2}})
+    guardar(url, "medellin", {}, borrar=[1])
+    assert leer(url, "medellin") == {2: {"b": 2}}
+
+
+def test_escrituras_se_agrupan_en_un_lote(url):
+    async def correr():
+        p = app.PersistenciaSQL(url)
+        await p.get_user_data()
+        await asyncio.gather(*(p.update_user_data(uid, {"n": uid}) for uid in range(50)))
+        await p.flush()
+        return p
+    p = asyncio.run(correr())
+    assert p.lotes_escritos == 1
+    assert len(leer(url, "")) == 50
+
+
+def test_fila_ilegible_se_descarta(url):
+    guardar(url, "", {1: {"ok": True}})
+    db = app.conexion_compartida(url)
+    db.transaccion(lambda cur: cur.executemany(
+        "INSERT INTO ptb_datos (tipo, clave, datos) VALUES (?, ?, ?)",
+        [("user", "2", b"no es pickle"), ("user", "3", pickle.dumps({"ok": 3})[:-4])],
+    ))
+
+    p = app.PersistenciaSQL(url)
+    assert asyncio.run(p.get_user_data()) == {1: {"ok": True}}
+    assert p.filas_descartadas == 2
+
+
+def test_transaccion_fallida_hace_rollback(url):
+    db = app.conexion_compartida(url)
+    db.transaccion(lambda cur: cur.execute("CREATE TABLE t (k INTEGER PRIMARY KEY)"))
+
+    def duplicado(cur):
+        cur.execute("INSERT INTO t VALUES (1)")
+        cur.execute("INSERT INTO t VALUES (1)")
+    with pytest.raises(Exception):
+        db.transaccion(duplicado)
+
+    # Lo insertado antes del error no quedó a medias y la conexión sigue sirviendo
+    db.transaccion(lambda cur: cur.execute("INSERT INTO t VALUES (2)"))
+    assert db.transaccion(lambda cur: cur.execute("SELECT k FROM t").fetchall()) == [(2,)]
+
+
+def test_error_de_conexion_reabre(url):
+    db = app.conexion_compartida(url)
+    anterior = db.conn
+    with pytest.raises(Exception):
+        db.transaccion(lambda cur: cur.execute("SELECT * FROM no_existe"))
+    assert db.reconexiones == 1 and db.conn is not anterior
+    assert db.transaccion(lambda cur: cur.execute("SELECT 1").fetchall()) == [(1,)]
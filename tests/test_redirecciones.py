@@ -0,0 +1,73 @@
+"""
+Enlaces cortos /r/<codigo>: redirección, códigos desconocidos y persistencia
+de los clics como eventos de analítica.
+"""
+import asyncio
+
+import pytest
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+
+import app
+
+DESTINO = "https://drive.google.com/file/d/abc/view"
+
+
+@pytest.fixture
+def redirecciones(monkeypatch):
+    r = app.Redirecciones(True, "https://bot.example", "secreto", 60)
+    monkeypatch.setattr(app, "REDIRECCIONES", r)
+    return r
+
+
+def pedir(ruta: str):
+    """GET contra servidor_web() en un puerto libre, sin seguir redirecciones."""
+    async def correr():
+        sock, puerto = bind_unused_port()
+        server = HTTPServer(app.servidor_web([]))
+        server.add_sockets([sock])
+        try:
+            return await AsyncHTTPClient().fetch(
+                f"http://127.0.0.1:{puerto}{ruta}", follow_redirects=False, raise_error=False
+            )
+        finally:
+            server.stop()
+    return asyncio.run(correr())
+
+
+def test_codigo_conocido_redirige(redirecciones):
+    corta = redirecciones.url(DESTINO, "p2:Drive")
+    assert corta.startswith("https://bot.example/r/")
+
+    respuesta = pedir(corta.removeprefix("https://bot.example"))
+    assert respuesta.code == 302
+    assert respuesta.headers["Location"] == DESTINO
+    assert redirecciones.clics["p2:Drive"] == 1
+
+
+def test_codigo_desconocido_es_404(redirecciones):
+    redirecciones.url(DESTINO, "p2:Drive")
+    assert pedir("/r/noexiste").code == 404
+    assert not redirecciones.clics
+
+
+def test_persistir_envia_clics_a_analitica(redirecciones, monkeypatch):
+    registrados = []
+    monkeypatch.setattr(app.ANALITICA, "registrar", lambda *a, **k: registrados.append((a, k)))
+    codigo = redirecciones.url(DESTINO, "p2:Drive").rsplit("/", 1)[1]
+    redirecciones.resolver(codigo)
+    redirecciones.resolver(codigo)
+
+    redirecciones.persistir()
+    assert registrados == [(("clic_url", 0, "p2:Drive"), {"n": 2})]
+    redirecciones.persistir()
+    assert len(registrados) == 1
+
+
+def test_sin_webhook_no_hay_redirecciones():
+    # conftest pide redirecciones con USE_WEBHOOK=true pero sin WEBHOOK_HOST:
+    # el bot corre en polling y las URLs deben quedar directas
+    assert not app.MODO_WEBHOOK
+    assert not app.REDIRECCIONES.habilitado
+    assert app.REDIRECCIONES.url(DESTINO, "x") == DESTINO
@@ -0,0 +1,154 @@
+"""
+PoliticaReintentos.llamar con corrutinas falsas: presupuesto global, circuit
+breaker, tope de RetryAfter y envíos que no se repiten si pudieron llegar.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+import app
+
+
+def politica(**kw):
+    valores = dict(intentos=4, base=0.001, maximo=0.05, presupuesto=100, ventana=60,
+                   umbral_circuito=100, espera_circuito=60)
+    valores.update(kw)
+    return app.PoliticaReintentos(**valores)
+
+
+def encadenado(error, causa):
+    """Como lo lanza PTB: `raise TimedOut from httpx.ReadTimeout(...)`."""
+    error.__cause__ = causa
+    return error
+
+
+class Falsa:
+    """Corrutina que lanza los errores dados en orden y después responde "ok"."""
+
+    def __init__(self, *errores, nombre="send_message"):
+        self.errores = list(errores)
+        self.llamadas = 0
+        self.__name__ = nombre
+
+    async def __call__(self, *args, **kwargs):
+        self.llamadas += 1
+        if self.errores:
+            error = self.errores.pop(0)
+            raise error() if callable(error) else error
+        return "ok"
+
+
+def llamar(p, fn, **kw):
+    return asyncio.run(p.llamar(fn, **kw))
+
+
+def test_reintenta_hasta_responder():
+    p = politica()
+    fn = Falsa(NetworkError("Bad Gateway"), NetworkError("Bad Gateway"))
+    assert llamar(p, fn) == "ok"
+    assert (fn.llamadas, p.reintentos) == (3, 2)
+
+
+def test_presupuesto_global_agotado():
+    p = politica(intentos=10, presupuesto=2, ventana=3600)
+    fn = Falsa(*[NetworkError("Bad Gateway")] * 10)
+    with pytest.raises(NetworkError):
+        llamar(p, fn)
+    # Dos fichas: tres intentos y se corta aunque quedaban intentos por llamada
+    assert (fn.llamadas, p.reintentos, p.sin_presupuesto) == (3, 2, 1)
+
+    otra = Falsa(NetworkError("Bad Gateway"))
+    with pytest.raises(NetworkError):
+        llamar(p, otra)
+    assert otra.llamadas == 1
+
+
+def test_circuito_abre_y_se_recupera():
+    p = politica(intentos=1, umbral_circuito=3, espera_circuito=0.05)
+    for _ in range(3):
+        with pytest.raises(NetworkError):
+            llamar(p, Falsa(NetworkError("Bad Gateway")))
+    assert p.circuito_abierto and p.aperturas == 1
+
+    rechazada = Falsa()
+    with pytest.raises(app.CircuitoAbierto):
+        llamar(p, rechazada)
+    assert (rechazada.llamadas, p.rechazadas) == (0, 1)
+
+    # Pasada la espera, la siguiente llamada hace de prueba y cierra el circuito
+    time.sleep(0.06)
+    assert llamar(p, Falsa()) == "ok"
+    assert not p.circuito_abierto and p._fallos_seguidos == 0
+
+
+def test_retry_after_sobre_el_tope_falla_de_inmediato():
+    p = politica(maximo=0.05)
+    fn = Falsa(RetryAfter(30))
+    with pytest.raises(RetryAfter):
+        llamar(p, fn)
+    assert (fn.llamadas, p.limitadas, p.reintentos) == (1, 1, 0)
+
+
+def test_retry_after_corto_espera_y_reintenta():
+    p = politica(umbral_circuito=1)
+    fn = Falsa(RetryAfter(0))
+    assert llamar(p, fn) == "ok"
+    assert (fn.llamadas, p.reintentos) == (2, 1)
+    # El 429 es control de flujo: no abre el circuito
+    assert p.aperturas == 0
+
+
+@pytest.mark.parametrize("error", [
+    encadenado(TimedOut(), httpx.ReadTimeout("lectura")),
+    encadenado(NetworkError("httpx.ReadError: "), httpx.ReadError("conexión cortada")),
+    encadenado(NetworkError("httpx.RemoteProtocolError: "), httpx.RemoteProtocolError("cerrada")),
+    TimedOut(),
+])
+def test_envio_que_pudo_llegar_no_se_repite(error):
+    p = politica()
+    fn = Falsa(error)
+    with pytest.raises(NetworkError):
+        llamar(p, fn)
+    assert (fn.llamadas, p.envios_sin_reintento) == (1, 1)
+
+
+@pytest.mark.parametrize("error", [
+    encadenado(TimedOut(), httpx.ConnectTimeout("conexión")),
+    encadenado(TimedOut(), httpx.PoolTimeout("pool")),
+    encadenado(TimedOut(), httpx.WriteTimeout("escritura")),
+    encadenado(NetworkError("httpx.ConnectError: "), httpx.ConnectError("rechazada")),
+    NetworkError("Bad Gateway"),
+])
+def test_envio_que_no_llego_se_reintenta(error):
+    p = politica()
+    fn = Falsa(error)
+    assert llamar(p, fn) == "ok"
+    assert (fn.llamadas, p.envios_sin_reintento) == (2, 0)
+
+
+def test_edicion_se_reintenta_tras_lectura_cortada():
+    # Editar dos veces el mismo mensaje no duplica nada
+    p = politica()
+    fn = Falsa(encadenado(TimedOut(), httpx.ReadTimeout("lectura")), nombre="edit_message_text")
+    assert llamar(p, fn) == "ok"
+    assert fn.llamadas == 2
+
+
+def test_envio_explicito_y_deducido():
+    assert app.PoliticaReintentos.crea_mensaje(Falsa(nombre="reply_document"))
+    assert not app.PoliticaReintentos.crea_mensaje(Falsa(nombre="send_chat_action"))
+    p = politica()
+    fn = Falsa(encadenado(TimedOut(), httpx.ReadTimeout("lectura")), nombre="edit_message_text")
+    with pytest.raises(TimedOut):
+        llamar(p, fn, envio=True)
+    assert fn.llamadas == 1
+
+
+def test_mensaje_sin_cambios_se_ignora():
+    p = politica()
+    fn = Falsa(BadRequest("Message is not modified: specified new message content is the same"))
+    assert llamar(p, fn) is None
+    assert (fn.llamadas, p.no_modificados) == (1, 1)
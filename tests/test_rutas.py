@@ -0,0 +1,106 @@
+"""
+Cada ruta de menu_callbacks y del teclado persistente, con el número exacto de
+llamadas a la Bot API que hace. Un cambio que agregue viajes a Telegram en una
+ruta debe hacer fallar su caso aquí.
+"""
+from collections import Counter
+
+import pytest
+
+import app
+from conftest import ADMIN, CEDULA
+
+EDITA = {"answerCallbackQuery": 1, "editMessageText": 1}
+RESPONDE = {"answerCallbackQuery": 1, "sendMessage": 1}
+
+
+def llamadas(api) -> Counter:
+    return Counter(api.metodos())
+
+
+@pytest.mark.parametrize(
+    "data, esperado",
+    [
+        ("volver_menu_principal", EDITA),
+        ("menu_agenda", {**EDITA, "sendMessage": 1}),
+        ("menu_material", EDITA),
+        ("mat_pres:p2", EDITA),
+        ("mat_videos:p2", EDITA),
+        ("mat_videos_url:p2", EDITA),
+        ("mat_videos_url:p5", EDITA),
+        ("mat_docs:p2", EDITA),
+        ("mat_docs:p1", EDITA),
+        ("menu_enlaces", EDITA),
+        ("enlaces_por_presentador", EDITA),
+        ("link_pres:p2", EDITA),
+        ("enlaces_conexion", EDITA),
+        ("menu_ubicacion", EDITA),
+        ("menu_exness", EDITA),
+        ("menu_wifi", EDITA),
+        ("video:p1:No existe", RESPONDE),
+        ("doc:p2:No existe", RESPONDE),
+    ],
+)
+def test_callback(bot, api, data, esperado):
+    bot.ingresar()
+    bot.tocar(data)
+    assert llamadas(api) == Counter(esperado)
+    assert api.bytes_subidos() == 0
+
+
+@pytest.mark.parametrize(
+    "texto, mensajes",
+    [
+        (app.BTN_AGENDA, 2),
+        (app.BTN_MATERIAL, 1),
+        (app.BTN_ENLACES, 1),
+        (app.BTN_UBICACION, 1),
+        (app.BTN_WIFI, 1),
+        (app.BTN_CERRAR, 1),
+        ("hola", 1),
+    ],
+)
+def test_boton_teclado(bot, api, texto, mensajes):
+    bot.ingresar()
+    bot.enviar(texto)
+    assert llamadas(api) == Counter(sendMessage=mensajes)
+
+
+def test_ingreso(bot, api):
+    bot.enviar("/start")
+    bot.enviar("no-inscrito@example.com")
+    assert llamadas(api) == Counter(sendMessage=2)
+    assert "perfil" not in bot.app.user_data[77]
+
+    api.llamadas.clear()
+    bot.enviar(CEDULA)
+    assert llamadas(api) == Counter(sendMessage=2)
+    assert bot.app.user_data[77]["perfil"] == {"nombre": bot.evento.roster()[CEDULA], "autenticado": True}
+
+
+def test_callback_sin_ingresar(bot, api):
+    bot.tocar("menu_material")
+    assert llamadas(api) == Counter(EDITA)
+    assert "validarte" in api.ultima("editMessageText").params["text"]
+
+
+def test_menu_sin_ingresar(bot, api):
+    bot.enviar("/menu")
+    assert "validarte" in api.ultima("sendMessage").params["text"]
+
+
+def test_comandos_admin(bot, api):
+    bot.enviar("/estado")
+    assert api.contar() == 0
+
+    for comando in ("/estado", "/estadisticas"):
+        bot.enviar(comando, user_id=ADMIN)
+    assert llamadas(api) == Counter(sendMessage=2)
+
+
+def test_recargar_roster(bot, api):
+    anterior = bot.evento.roster()
+    bot.enviar("/recargar_roster", user_id=ADMIN)
+    assert "Inscritos recargados" in api.ultima("sendMessage").params["text"]
+    # El diccionario se reemplaza entero, nunca queda vacío entre medio
+    assert bot.evento.roster() == anterior and bot.evento.roster() is not anterior